@@ -0,0 +1,94 @@
+"""
+Measures text task dequeue latency as the number of blocked (not yet
+ready) tasks grows.  Run against a scratch database:
+
+    DATABASE_URL=postgres://... python bench_dequeue.py [max_tasks]
+
+Exits non-zero when a dequeue's median latency exceeds MAX_DEQUEUE_MS.
+
+Every row it creates is tagged with BENCH_MARKER and removed at the end.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import statistics
+import sys
+import time
+
+from db import *
+
+BENCH_MARKER = "bench_dequeue"
+SIZES = [1_000, 10_000, 100_000]
+ROUNDS = 50
+# Exit 1 if a dequeue takes longer than this (ms, median) at any size:
+# blocked tasks must not slow down claiming a ready one
+MAX_DEQUEUE_MS = 50
+
+
+def seed_blocked(db: DB, count: int) -> None:
+    """
+    Insert `count` queued text tasks, each waiting on a file that will
+    never reach file_cache.
+    """
+    with db._conn_cur() as (_, cur):
+        cur.execute(
+            """
+            WITH task AS (
+                INSERT INTO text_task (isRunning, task_type, prompt_info, texts, files, pending_deps)
+                SELECT B'0', %s, %s, '{}', ARRAY[gen_random_uuid()], 1
+                FROM generate_series(1, %s)
+                RETURNING id, files
+            )
+            INSERT INTO text_task_dep (file_id, task_id)
+            SELECT task.files[1], task.id FROM task
+            """,
+            (TaskType.UNKNOWN.value, BENCH_MARKER, count),
+        )
+
+
+def time_dequeue(db: DB) -> float:
+    """Median milliseconds to claim one ready task behind the blocked ones."""
+    samples = []
+    for _ in range(ROUNDS):
+        db.enqueue_text_task(TaskType.UNKNOWN, [], [], BENCH_MARKER)
+        start = time.perf_counter()
+        task = db.dequeue_text_task()
+        samples.append((time.perf_counter() - start) * 1000)
+        if task is not None:
+            db.complete_text_task(task["id"])
+    return statistics.median(samples)
+
+
+def cleanup(db: DB) -> None:
+    with db._conn_cur() as (_, cur):
+        cur.execute("DELETE FROM text_task WHERE prompt_info = %s", (BENCH_MARKER,))
+
+
+if __name__ == "__main__":
+    max_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    db = DB()
+
+    slowest = 0.0
+    try:
+        seeded = 0
+        print(f"{'queued':>10}  {'dequeue ms':>10}")
+        for size in SIZES:
+            if size > max_tasks:
+                break
+            seed_blocked(db, size - seeded)
+            seeded = size
+            with db._conn_cur() as (_, cur):
+                cur.execute("ANALYZE text_task")
+                cur.execute("ANALYZE text_task_dep")
+            ms = time_dequeue(db)
+            slowest = max(slowest, ms)
+            print(f"{seeded:>10}  {ms:>10.3f}")
+    finally:
+        cleanup(db)
+        db.close()
+
+    if slowest > MAX_DEQUEUE_MS:
+        print(f"Dequeue took {slowest:.3f} ms, over the {MAX_DEQUEUE_MS} ms budget")
+        sys.exit(1)
@@ -0,0 +1,254 @@
+"""
+Fails (exit 1) if a hot-path query plans a sequential scan over a large
+table. Run against a scratch database:
+
+    DATABASE_URL=postgres://... python check_query_plans.py [students]
+
+Everything is seeded inside one transaction that is rolled back at the
+end, so nothing is left behind. The queries checked are the real DB
+methods: their SQL is captured and EXPLAINed instead of executed.
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import json
+import sys
+from contextlib import contextmanager
+
+from db import *
+
+STUDENTS = 2_000
+ASSIGNMENTS = 100
+CLASSES = 20
+# Mostly running tasks with a handful queued, as on a busy runner
+TASKS = 100_000
+QUEUED_TASKS = 10
+
+# Tables too big to scan on every request
+LARGE_TABLES = {
+    "files",
+    "file_cache",
+    "user_results",
+    "file_task",
+    "text_task",
+    "failed_tasks",
+    "enrollments",
+}
+
+PLAN_MARKER = "plan-check"
+
+
+class ExplainCursor:
+    """Cursor stand-in that EXPLAINs each statement instead of running it."""
+
+    def __init__(self, cur, plans: list):
+        self._cur = cur
+        self._plans = plans
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self._cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        self._plans.append((sql, self._cur.fetchone()[0][0]["Plan"]))
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+class ExplainDB(DB):
+    """DB whose queries run as EXPLAINs inside the seeding transaction."""
+
+    def __init__(self, con):
+        super().__init__(migrate=False)
+        self._seeded = con
+        self.plans = []
+
+    @contextmanager
+    def _conn_cur(self):
+        with self._seeded.cursor() as cur:
+            yield self._seeded, ExplainCursor(cur, self.plans)
+
+
+def seed(cur, students: int) -> dict:
+    """Fill every hot table; returns ids to query with."""
+    cur.execute(
+        """
+        INSERT INTO users (openid, name, email, role, classes)
+        SELECT %s || '-' || n, 'Student ' || n, n || '@example.com', %s, '{}'
+        FROM generate_series(1, %s) n
+        """,
+        (PLAN_MARKER, UserRole.STUDENT.value, students),
+    )
+    cur.execute(
+        """
+        INSERT INTO classes (owner, name, joinCode, assignments)
+        SELECT %s || '-1', 'Class ' || n, -n, '{}'
+        FROM generate_series(1, %s) n
+        RETURNING id
+        """,
+        (PLAN_MARKER, CLASSES),
+    )
+    classes = [r[0] for r in cur.fetchall()]
+    cur.execute(
+        """
+        INSERT INTO enrollments (user_id, class_id)
+        SELECT %s || '-' || n, (%s::uuid[])[1 + n %% %s]
+        FROM generate_series(1, %s) n
+        """,
+        (PLAN_MARKER, classes, len(classes), students),
+    )
+    cur.execute(
+        """
+        INSERT INTO assignments (name, files)
+        SELECT 'Assignment ' || n, '{}'
+        FROM generate_series(1, %s) n
+        RETURNING id
+        """,
+        (ASSIGNMENTS,),
+    )
+    assignments = [r[0] for r in cur.fetchall()]
+    cur.execute(
+        """
+        INSERT INTO class_assignments (class_id, assignment_id)
+        SELECT (%s::uuid[])[1 + (n - 1) %% %s], a
+        FROM unnest(%s::uuid[]) WITH ORDINALITY AS t(a, n)
+        """,
+        (classes, len(classes), assignments),
+    )
+
+    # One submission, its OCR output and one grade per student per assignment
+    cur.execute(
+        """
+        INSERT INTO files (posted_user, file_name, file_role, file_assignment)
+        SELECT %s || '-' || s, 'student.pdf', %s, a
+        FROM generate_series(1, %s) s, unnest(%s::uuid[]) a
+        """,
+        (PLAN_MARKER, FileRole.STUDENT_RESPONSE.value, students, assignments),
+    )
+    cur.execute(
+        """
+        INSERT INTO file_cache (id, results)
+        SELECT id, 'extracted text'
+        FROM files
+        WHERE posted_user LIKE %s
+        """,
+        (PLAN_MARKER + "-%",),
+    )
+    cur.execute(
+        """
+        INSERT INTO user_results (student_copy, result, status)
+        SELECT id, 'feedback', 'complete'
+        FROM files
+        WHERE posted_user LIKE %s
+        """,
+        (PLAN_MARKER + "-%",),
+    )
+
+    cur.execute(
+        """
+        INSERT INTO file_task (isRunning, task_type, prompt_info, files, lease_expires)
+        SELECT CASE WHEN n <= %s THEN B'0' ELSE B'1' END, %s, %s,
+               ARRAY[gen_random_uuid()], now() + interval '1 hour'
+        FROM generate_series(1, %s) n
+        """,
+        (QUEUED_TASKS, TaskType.OCR.value, PLAN_MARKER, TASKS),
+    )
+    cur.execute(
+        """
+        INSERT INTO text_task (isRunning, task_type, prompt_info, texts, files, pending_deps, lease_expires)
+        SELECT CASE WHEN n <= %s THEN B'0' ELSE B'1' END, %s, %s, '{}',
+               ARRAY[gen_random_uuid(), gen_random_uuid()], 0, now() + interval '1 hour'
+        FROM generate_series(1, %s) n
+        """,
+        (QUEUED_TASKS, TaskType.SUMMARIZE.value, PLAN_MARKER, TASKS),
+    )
+    cur.execute(
+        """
+        INSERT INTO failed_tasks (queue, task_id, task_type, prompt_info, files, attempts, error)
+        SELECT 'file', n, %s, %s, ARRAY[gen_random_uuid()], %s, 'seeded'
+        FROM generate_series(1, %s) n
+        """,
+        (TaskType.OCR.value, PLAN_MARKER, MAX_TASK_ATTEMPTS, TASKS // 10),
+    )
+
+    for table in sorted(LARGE_TABLES | {"users", "classes", "assignments"}):
+        cur.execute(f"ANALYZE {table}")
+
+    cur.execute(
+        "SELECT id::text FROM files WHERE posted_user = %s LIMIT 5",
+        (PLAN_MARKER + "-1",),
+    )
+    return {
+        "student": PLAN_MARKER + "-1",
+        "class": classes[0],
+        "assignment": assignments[0],
+        "files": [r[0] for r in cur.fetchall()],
+    }
+
+
+def seq_scans(plan: dict) -> list:
+    """Large tables read with a Seq Scan anywhere in `plan`."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in LARGE_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def checks(db: ExplainDB, ids: dict) -> dict:
+    """Name -> callable issuing one hot-path query family."""
+    return {
+        "get_file_by_user_on_assignment": lambda: db.get_file_by_user_on_assignment(
+            ids["student"], ids["assignment"]
+        ),
+        "get_result_by_student_copy": lambda: db.get_result_by_student_copy(ids["files"][0]),
+        "get_user_results_for_assignment": lambda: db.get_user_results_for_assignment(
+            ids["student"], ids["assignment"]
+        ),
+        "get_assignment_gradebook": lambda: db.get_assignment_gradebook(ids["assignment"]),
+        "get_class_roster": lambda: db.get_class_roster(ids["class"]),
+        "get_user_classes": lambda: db.get_user_classes(ids["student"]),
+        "get_class_assignments": lambda: db.get_class_assignments(ids["class"]),
+        "get_assignment_owner": lambda: db.get_assignment_owner(ids["assignment"]),
+        "get_submission_states": lambda: db.get_submission_states(ids["files"]),
+        "dequeue_file_tasks": lambda: db.dequeue_file_tasks(4, PLAN_MARKER),
+        "dequeue_text_tasks": lambda: db.dequeue_text_tasks(4, PLAN_MARKER),
+        "reclaim_expired_leases": lambda: db.reclaim_expired_leases(),
+    }
+
+
+if __name__ == "__main__":
+    students = int(sys.argv[1]) if len(sys.argv) > 1 else STUDENTS
+    base = DB()
+    con = base.pool.getconn()
+    failed = False
+    try:
+        with con.cursor() as cur:
+            ids = seed(cur, students)
+
+        db = ExplainDB(con)
+        try:
+            for name, run in checks(db, ids).items():
+                db.plans.clear()
+                run()
+                scans = sorted({t for _, plan in db.plans for t in seq_scans(plan)})
+                if scans:
+                    failed = True
+                    print(f"FAIL  {name}: sequential scan on {', '.join(scans)}")
+                    for _, plan in db.plans:
+                        print(json.dumps(plan, indent=2))
+                else:
+                    print(f"ok    {name}")
+        finally:
+            db.close()
+    finally:
+        con.rollback()
+        base.pool.putconn(con)
+        base.close()
+
+    sys.exit(1 if failed else 0)
@@ -1,83 +1,61 @@
-from openai import OpenAI
+from openai import (
+    AsyncOpenAI,
+    BadRequestError,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    NotFoundError,
+    OpenAI,
+)
+import asyncio
+import httpx
+import hashlib
+import io
 import os
+import threading
+import time
+from tempfile import SpooledTemporaryFile
+from typing import Any, Awaitable, BinaryIO, Callable, Optional, Tuple, Union
 from dotenv import load_dotenv
 import db
 import json
 import re
+from ratelimit import (
+    EXPECTED_OUTPUT_TOKENS,
+    RateLimiter,
+    estimate_file_tokens,
+    estimate_text_tokens,
+)
 
-class AIGrader:
-    def __init__(self):
-        # Load API keys from .env
-        load_dotenv()
-        self.teacher_key = os.getenv("teacher_file_api")
-        self.student_key = os.getenv("student_file_api")
-        self.grader_key = os.getenv("grader_api_key")
+MODEL = "gpt-5"
+TEACHER_FILE_PROMPT = "Summarize and extract the key solutions and answers from this exam key PDF."
+STUDENT_FILE_PROMPT = "Extract and summarize the student's responses from this exam submission PDF."
 
-        # Initialize OpenAI clients
-        self.teacher_client = OpenAI(api_key=self.teacher_key)
-        self.student_client = OpenAI(api_key=self.student_key)
-        self.grader_client = OpenAI(api_key=self.grader_key)
+# Typeset pages are read from the PDF's own text layer; optionally a small
+# model tidies that text instead of running full OCR on the page images.
+CLEANUP_MODEL = "gpt-5-nano"
+CLEANUP_PROMPT = (
+    "The text below was extracted from the embedded text layer of an exam PDF. "
+    "Fix broken line wraps, spacing and math notation so it reads cleanly. "
+    "Do not add, remove or summarize any content.\n\n"
+)
 
-    def read_teacher_file(self, file_path: str) -> str:
-        """Upload and process the teacher's answer key PDF."""
-        print("Uploading and reading teacher file...")
-        teacher_file = self.teacher_client.files.create(
-            file=open(file_path, "rb"),
-            purpose="user_data"
-        )
-        teacher_response = self.teacher_client.responses.create(
-            model="gpt-5",
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": "Summarize and extract the key solutions and answers from this exam key PDF."},
-                        {"type": "input_file", "file_id": teacher_file.id},
-                    ],
-                }
-            ],
-        )
-        print("Teacher file processed.\n")
-        return teacher_response.output_text
+# Bump OCR_PIPELINE_VERSION whenever the OCR prompts or the way PDFs are
+# read (text layer, page ranges) change: cached OCR output is keyed by it.
+OCR_PIPELINE_VERSION = 3
 
-    def read_student_file(self, file_path: str) -> str:
-        """Upload and process the student's exam submission PDF."""
-        print("Uploading and reading student file...")
-        student_file = self.student_client.files.create(
-            file=open(file_path, "rb"),
-            purpose="user_data"
-        )
-        student_response = self.student_client.responses.create(
-            model="gpt-5",
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": "Extract and summarize the student's responses from this exam submission PDF."},
-                        {"type": "input_file", "file_id": student_file.id},
-                    ],
-                }
-            ],
-        )
-        #Only output valied json of this schema: 
-        #{r'{score achieved: int, total_score: int, detailed_feedback: str}'}
-        print("Student file processed.\n")
-        return student_response.output_text
+# Bump GRADING_PROMPT_VERSION whenever GRADING_PROMPT changes: memoized
+# grades are keyed by it and older versions are evicted at runner startup.
+GRADING_PROMPT_VERSION = 2
 
-    def grade_submission(self, teacher_text: str, student_text: str) -> str:
-     
-        grading_prompt = f"""
+# The instructions and the exam key come first and are identical for every
+# student of an assignment, so the provider can serve them from its prompt
+# cache; only the trailing submission differs between calls.
+GRADING_PROMPT = """
    Grade the student's submission based on the teacher's answer key.
 
 You are an expert grader in the subject covered by this exam, with 20 years of experience grading midterms at the highest academic level. 
 Your goal is to replace teachers in providing fast, fair, and highly accurate grading.
 
-The teacher's answer key and the student's submission are provided below.
-Exam Key:
-{teacher_text}
-
-Student Submission:
-{student_text}
 Ensure that the point totals match the exam key. The point value of each question should be located the left of the question number and the right of the question. If point totals are missing however assume the exam is gradd out of 100. 
 Output the question point value for each question as you see it in the midterm.
 Correct answers with no support work may receive no credit. 
@@ -115,16 +93,619 @@ Additional Instructions for Grading:
    - Provide constructive feedback that the student can learn from.
 
    If the grade you assign is less than 50% of the total possible points, double-check your grading to ensure accuracy and fairness. Likewise, if the student has achieved a perfect score, verify that all answers are indeed correct.
+
+The teacher's answer key is provided below, followed by the student's submission.
+Exam Key:
+{teacher_text}
 """
+GRADING_SUBMISSION = """
+Student Submission:
+{student_text}
+"""
+
+# A PDF to read: a path, its bytes, or a seekable binary file object
+FileInput = Union[str, bytes, BinaryIO]
+
+# Uploaded PDFs expire at the provider after PROVIDER_FILE_TTL seconds and
+# are reused by content hash until PROVIDER_FILE_MARGIN before that.
+PROVIDER_FILE_TTL = int(os.getenv("PROVIDER_FILE_TTL", 7 * 24 * 3600))
+PROVIDER_FILE_MARGIN = 3600
+# Expired uploads deleted per garbage-collection run, and the timeout (s)
+# of each provider DELETE; the rest wait for the next run.
+UPLOAD_GC_BATCH = 50
+UPLOAD_GC_TIMEOUT = 10
+
+# Keep-alive connections are held this long between calls
+KEEPALIVE_EXPIRY = 120
+
+
+def grading_memo_key(teacher_text: str, student_text: str) -> Tuple[str, str, int]:
+    """(teacher hash, student hash, prompt version) identifying a grading."""
+    return (
+        hashlib.sha256(teacher_text.encode()).hexdigest(),
+        hashlib.sha256(student_text.encode()).hexdigest(),
+        GRADING_PROMPT_VERSION,
+    )
+
+
+class ConnectionStats:
+    """
+    Counts HTTP requests and the fresh TCP connections they needed, via
+    httpcore's trace hook, to show how often pooled connections are reused.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    async def _atrace(self, event_name: str, info: dict) -> None:
+        self._trace(event_name, info)
+
+    def on_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def aon_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._atrace
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            requests, new = self.requests, self.new_connections
+        return {
+            "requests": requests,
+            "new_connections": new,
+            "reused": max(requests - new, 0),
+            "reuse_ratio": round(1 - new / requests, 3) if requests else None,
+        }
+
+
+class UploadStats:
+    """Files uploaded vs. reused by id, and the upload bytes reuse saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.reused = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+
+    def record(self, reused: bool, size: int) -> None:
+        with self._lock:
+            if reused:
+                self.reused += 1
+                self.bytes_saved += size
+            else:
+                self.uploads += 1
+                self.bytes_uploaded += size
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uploads": self.uploads,
+                "reused": self.reused,
+                "bytes_uploaded": self.bytes_uploaded,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+class AIGrader:
+    def __init__(self, concurrency: int = 4):
+        # Load API keys from .env
+        load_dotenv()
+        self.teacher_key = os.getenv("teacher_file_api")
+        self.student_key = os.getenv("student_file_api")
+        self.grader_key = os.getenv("grader_api_key")
+
+        # All three keys talk to the same host, so they share one keep-alive
+        # pool sized to the number of tasks that can call out at once.
+        self.stats = ConnectionStats()
+        limits = httpx.Limits(
+            max_connections=concurrency,
+            max_keepalive_connections=concurrency,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self.http_client = DefaultHttpxClient(
+            limits=limits, event_hooks={"request": [self.stats.on_request]}
+        )
+        self.async_http_client = DefaultAsyncHttpxClient(
+            limits=limits, event_hooks={"request": [self.stats.aon_request]}
+        )
+
+        # Initialize OpenAI clients
+        self.teacher_client = OpenAI(api_key=self.teacher_key, http_client=self.http_client)
+        self.student_client = OpenAI(api_key=self.student_key, http_client=self.http_client)
+        self.grader_client = OpenAI(api_key=self.grader_key, http_client=self.http_client)
+
+        # Async twins used by the asyncio runner; they must only be awaited
+        # from a single event loop.
+        self.async_teacher_client = AsyncOpenAI(api_key=self.teacher_key, http_client=self.async_http_client)
+        self.async_student_client = AsyncOpenAI(api_key=self.student_key, http_client=self.async_http_client)
+        self.async_grader_client = AsyncOpenAI(api_key=self.grader_key, http_client=self.async_http_client)
+
+        # One budget per key, shared by the sync and async clients
+        self.teacher_limiter = RateLimiter.from_env("teacher_file_api")
+        self.student_limiter = RateLimiter.from_env("student_file_api")
+        self.grader_limiter = RateLimiter.from_env("grader_api_key")
+
+        # Optional callback(purpose, model, input_tokens, cached_tokens,
+        # output_tokens) invoked after every model call
+        self.usage_sink: Optional[Callable[[str, str, int, int, int], None]] = None
+
+        # Optional store of uploaded file ids (get/set/forget_provider_file,
+        # see db.DB); without one every read uploads the PDF again.
+        self.file_registry: Optional["db.DB"] = None
+        self.upload_stats = UploadStats()
+        # Uploads belong to the key that made them; the limiters carry the
+        # key's env name, which is what file ids are registered under.
+        self._clients_by_key = {
+            self.teacher_limiter.name: self.teacher_client,
+            self.student_limiter.name: self.student_client,
+            self.grader_limiter.name: self.grader_client,
+        }
+
+    @staticmethod
+    def _file_input(prompt: str, file_id: str) -> list:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": prompt},
+                    {"type": "input_file", "file_id": file_id},
+                ],
+            }
+        ]
+
+    @staticmethod
+    def _total_tokens(response) -> Optional[int]:
+        usage = getattr(response, "usage", None)
+        return getattr(usage, "total_tokens", None)
+
+    def _record_usage(self, purpose: str, response) -> None:
+        """Hand a call's token counts, including cache hits, to usage_sink."""
+        usage = getattr(response, "usage", None)
+        if self.usage_sink is None or usage is None:
+            return
+        details = getattr(usage, "input_tokens_details", None)
+        try:
+            self.usage_sink(
+                purpose,
+                getattr(response, "model", MODEL),
+                usage.input_tokens,
+                getattr(details, "cached_tokens", 0) or 0,
+                usage.output_tokens,
+            )
+        except Exception as e:
+            print(f"Could not record usage for {purpose}: {e}")
+
+    def _respond(self, purpose: str, client: OpenAI, limiter: RateLimiter, estimate: int, **kwargs):
+        """responses.create, after waiting for room in the key's budget."""
+        reserved = estimate + EXPECTED_OUTPUT_TOKENS
+        # A call that raises (timeout, 429, 5xx) is settled as using nothing,
+        # so it does not keep its estimate charged against the budget
+        used = 0
+        limiter.acquire(reserved)
+        try:
+            response = client.responses.create(**kwargs)
+            used = self._total_tokens(response)
+        finally:
+            limiter.settle(reserved, used)
+        self._record_usage(purpose, response)
+        return response
+
+    async def _arespond(self, purpose: str, client: AsyncOpenAI, limiter: RateLimiter, estimate: int, **kwargs):
+        """Async _respond."""
+        reserved = estimate + EXPECTED_OUTPUT_TOKENS
+        used = 0
+        try:
+            await limiter.aacquire(reserved)
+            response = await client.responses.create(**kwargs)
+            used = self._total_tokens(response)
+        finally:
+            limiter.settle(reserved, used)
+        await asyncio.to_thread(self._record_usage, purpose, response)
+        return response
+
+    def _respond_stream(self, purpose: str, client: OpenAI, limiter: RateLimiter, estimate: int, on_delta: Callable[[str], None], **kwargs):
+        """
+        Streaming _respond: on_delta(text) is called for every output text
+        delta as it arrives. Returns (final response, ms to first token).
+        """
+        reserved = estimate + EXPECTED_OUTPUT_TOKENS
+        used = 0
+        limiter.acquire(reserved)
+        try:
+            started = time.monotonic()
+            ttft_ms = None
+            response = None
+            for event in client.responses.create(stream=True, **kwargs):
+                if event.type == "response.output_text.delta":
+                    if ttft_ms is None:
+                        ttft_ms = int((time.monotonic() - started) * 1000)
+                    on_delta(event.delta)
+                elif event.type in ("response.completed", "response.incomplete"):
+                    response = event.response
+                elif event.type in ("response.failed", "error"):
+                    raise RuntimeError(f"{purpose} stream failed: {event}")
+            if response is None:
+                raise RuntimeError(f"{purpose} stream ended without a response")
+            used = self._total_tokens(response)
+        finally:
+            limiter.settle(reserved, used)
+        self._record_usage(purpose, response)
+        return response, ttft_ms
+
+    async def _arespond_stream(self, purpose: str, client: AsyncOpenAI, limiter: RateLimiter, estimate: int, on_delta: Callable[[str], Awaitable[None]], **kwargs):
+        """Async _respond_stream; on_delta is awaited."""
+        reserved = estimate + EXPECTED_OUTPUT_TOKENS
+        used = 0
+        try:
+            await limiter.aacquire(reserved)
+            started = time.monotonic()
+            ttft_ms = None
+            response = None
+            async for event in await client.responses.create(stream=True, **kwargs):
+                if event.type == "response.output_text.delta":
+                    if ttft_ms is None:
+                        ttft_ms = int((time.monotonic() - started) * 1000)
+                    await on_delta(event.delta)
+                elif event.type in ("response.completed", "response.incomplete"):
+                    response = event.response
+                elif event.type in ("response.failed", "error"):
+                    raise RuntimeError(f"{purpose} stream failed: {event}")
+            if response is None:
+                raise RuntimeError(f"{purpose} stream ended without a response")
+            used = self._total_tokens(response)
+        finally:
+            limiter.settle(reserved, used)
+        await asyncio.to_thread(self._record_usage, purpose, response)
+        return response, ttft_ms
+
+    @staticmethod
+    def _file_payload(file: FileInput) -> Tuple[Any, int]:
+        """
+        (upload body, size in bytes) for a path, raw bytes or a seekable
+        binary file object. In-memory buffers are sent as bytes: httpx calls
+        fileno() on file objects to size them, which would make a
+        SpooledTemporaryFile roll over to disk. Only files already on disk
+        are streamed to the upload as is.
+        """
+        if isinstance(file, (bytes, bytearray)):
+            return bytes(file), len(file)
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                data = f.read()
+            return data, len(data)
+        if isinstance(file, SpooledTemporaryFile) and not file._rolled:
+            file = file._file
+        if isinstance(file, io.BytesIO):
+            data = file.getvalue()
+            return data, len(data)
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(0)
+        return file, size
+
+    @staticmethod
+    def _file_prompt(prompt: str, pages: Optional[Tuple[int, int]]) -> str:
+        if pages is None:
+            return prompt
+        return f"{prompt} This PDF holds pages {pages[0]}-{pages[1]} of the full document."
+
+    @staticmethod
+    def _payload_hash(body: Any) -> str:
+        """sha256 of an upload body, rewinding file objects afterwards."""
+        if isinstance(body, bytes):
+            return hashlib.sha256(body).hexdigest()
+        h = hashlib.sha256()
+        body.seek(0)
+        for chunk in iter(lambda: body.read(1 << 20), b""):
+            h.update(chunk)
+        body.seek(0)
+        return h.hexdigest()
+
+    def _lookup_upload(self, key_name: str, body: Any) -> Tuple[Optional[str], Optional[str]]:
+        """(content hash, reusable file id or None); (None, None) without a registry."""
+        if self.file_registry is None:
+            return None, None
+        digest = self._payload_hash(body)
+        try:
+            return digest, self.file_registry.get_provider_file(digest, key_name, PROVIDER_FILE_MARGIN)
+        except Exception as e:
+            print(f"Could not look up uploaded file: {e}")
+            return digest, None
+
+    def _register_upload(self, key_name: str, digest: Optional[str], file_id: str, size: int) -> None:
+        if self.file_registry is None or digest is None:
+            return
+        try:
+            self.file_registry.set_provider_file(digest, key_name, file_id, size, PROVIDER_FILE_TTL)
+        except Exception as e:
+            print(f"Could not register uploaded file {file_id}: {e}")
+
+    def _forget_upload(self, file_id: str) -> None:
+        try:
+            self.file_registry.forget_provider_file(file_id)
+        except Exception as e:
+            print(f"Could not forget uploaded file {file_id}: {e}")
+
+    @staticmethod
+    def _upload_kwargs(body: Any) -> dict:
+        return {
+            "file": ("exam.pdf", body, "application/pdf"),
+            "purpose": "user_data",
+            "expires_after": {"anchor": "created_at", "seconds": PROVIDER_FILE_TTL},
+        }
+
+    def _upload(self, client: OpenAI, key_name: str, body: Any, size: int, digest: Optional[str]) -> str:
+        uploaded = client.files.create(**self._upload_kwargs(body))
+        self.upload_stats.record(False, size)
+        self._register_upload(key_name, digest, uploaded.id, size)
+        return uploaded.id
+
+    async def _aupload(self, client: AsyncOpenAI, key_name: str, body: Any, size: int, digest: Optional[str]) -> str:
+        uploaded = await client.files.create(**self._upload_kwargs(body))
+        self.upload_stats.record(False, size)
+        await asyncio.to_thread(self._register_upload, key_name, digest, uploaded.id, size)
+        return uploaded.id
+
+    def _read_file(self, purpose: str, client: OpenAI, limiter: RateLimiter, file: FileInput, prompt: str) -> str:
+        """
+        Have the model read a PDF, reusing an earlier upload of the same
+        bytes under this key when the registry still has one.
+        """
+        body, size = self._file_payload(file)
+        digest, file_id = self._lookup_upload(limiter.name, body)
+        reused = file_id is not None
+        if reused:
+            self.upload_stats.record(True, size)
+        else:
+            file_id = self._upload(client, limiter.name, body, size, digest)
+
+        def respond(file_id: str):
+            return self._respond(
+                purpose,
+                client,
+                limiter,
+                estimate_text_tokens(prompt) + estimate_file_tokens(size),
+                model=MODEL,
+                input=self._file_input(prompt, file_id),
+            )
+
+        try:
+            response = respond(file_id)
+        except (NotFoundError, BadRequestError):
+            if not reused:
+                raise
+            # Deleted at the provider before its recorded expiry: upload anew
+            self._forget_upload(file_id)
+            response = respond(self._upload(client, limiter.name, body, size, digest))
+        return response.output_text
+
+    async def _aread_file(self, purpose: str, client: AsyncOpenAI, limiter: RateLimiter, file: FileInput, prompt: str) -> str:
+        """Async _read_file."""
+        body, size = self._file_payload(file)
+        digest, file_id = await asyncio.to_thread(self._lookup_upload, limiter.name, body)
+        reused = file_id is not None
+        if reused:
+            self.upload_stats.record(True, size)
+        else:
+            file_id = await self._aupload(client, limiter.name, body, size, digest)
+
+        async def respond(file_id: str):
+            return await self._arespond(
+                purpose,
+                client,
+                limiter,
+                estimate_text_tokens(prompt) + estimate_file_tokens(size),
+                model=MODEL,
+                input=self._file_input(prompt, file_id),
+            )
+
+        try:
+            response = await respond(file_id)
+        except (NotFoundError, BadRequestError):
+            if not reused:
+                raise
+            await asyncio.to_thread(self._forget_upload, file_id)
+            response = await respond(await self._aupload(client, limiter.name, body, size, digest))
+        return response.output_text
+
+    def delete_expired_uploads(self, limit: int = UPLOAD_GC_BATCH) -> int:
+        """
+        Garbage-collect up to `limit` uploads at or near expiry: drop them
+        from the registry and delete them at the provider, each call capped
+        at UPLOAD_GC_TIMEOUT without retries (a file left behind still
+        expires on its own). Returns how many went.
+        """
+        if self.file_registry is None:
+            return 0
+        expired = self.file_registry.pop_expired_provider_files(PROVIDER_FILE_MARGIN, limit)
+        for key_name, file_id in expired:
+            client = self._clients_by_key.get(key_name)
+            if client is None:
+                continue
+            try:
+                client.with_options(timeout=UPLOAD_GC_TIMEOUT, max_retries=0).files.delete(file_id)
+            except NotFoundError:
+                pass  # already expired at the provider
+            except Exception as e:
+                print(f"Could not delete uploaded file {file_id}: {e}")
+        return len(expired)
+
+    def read_teacher_file(self, file: FileInput, pages: Optional[Tuple[int, int]] = None) -> str:
+        """
+        Upload and process the teacher's answer key PDF .
+        `pages` tells the model which page range of a split document it sees.
+        """
+        print("Uploading and reading teacher file...")
+        out = self._read_file("teacher_ocr", self.teacher_client, self.teacher_limiter, file, self._file_prompt(TEACHER_FILE_PROMPT, pages))
+        print("Teacher file processed.\n")
+        return out
+
+    def read_student_file(self, file: FileInput, pages: Optional[Tuple[int, int]] = None) -> str:
+        """Upload and process the student's exam submission PDF ."""
+        print("Uploading and reading student file...")
+        out = self._read_file("student_ocr", self.student_client, self.student_limiter, file, self._file_prompt(STUDENT_FILE_PROMPT, pages))
+        #Only output valied json of this schema: 
+        #{r'{score achieved: int, total_score: int, detailed_feedback: str}'}
+        print("Student file processed.\n")
+        return out
+
+    async def aread_teacher_file(self, file: FileInput, pages: Optional[Tuple[int, int]] = None) -> str:
+        """Async read_teacher_file."""
+        return await self._aread_file("teacher_ocr", self.async_teacher_client, self.teacher_limiter, file, self._file_prompt(TEACHER_FILE_PROMPT, pages))
+
+    async def aread_student_file(self, file: FileInput, pages: Optional[Tuple[int, int]] = None) -> str:
+        """Async read_student_file."""
+        return await self._aread_file("student_ocr", self.async_student_client, self.student_limiter, file, self._file_prompt(STUDENT_FILE_PROMPT, pages))
+
+    def clean_text(self, text: str, teacher: bool) -> str:
+        """Cheap cleanup pass over text taken from a PDF's text layer."""
+        client, limiter = (
+            (self.teacher_client, self.teacher_limiter)
+            if teacher
+            else (self.student_client, self.student_limiter)
+        )
+        prompt = CLEANUP_PROMPT + text
+        response = self._respond(
+            "teacher_cleanup" if teacher else "student_cleanup",
+            client,
+            limiter,
+            estimate_text_tokens(prompt),
+            model=CLEANUP_MODEL,
+            input=prompt,
+        )
+        return response.output_text
+
+    async def aclean_text(self, text: str, teacher: bool) -> str:
+        """Async clean_text."""
+        client, limiter = (
+            (self.async_teacher_client, self.teacher_limiter)
+            if teacher
+            else (self.async_student_client, self.student_limiter)
+        )
+        prompt = CLEANUP_PROMPT + text
+        response = await self._arespond(
+            "teacher_cleanup" if teacher else "student_cleanup",
+            client,
+            limiter,
+            estimate_text_tokens(prompt),
+            model=CLEANUP_MODEL,
+            input=prompt,
+        )
+        return response.output_text
+
+    @staticmethod
+    def _grading_input(teacher_text: str, student_text: str) -> list:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": GRADING_PROMPT.format(teacher_text=teacher_text)},
+                    {"type": "input_text", "text": GRADING_SUBMISSION.format(student_text=student_text)},
+                ],
+            }
+        ]
+
+    @staticmethod
+    def _grading_cache_key(teacher_text: str) -> str:
+        """Routes every grading against the same key to the same prompt cache."""
+        return f"grade-v{GRADING_PROMPT_VERSION}-{hashlib.sha256(teacher_text.encode()).hexdigest()[:32]}"
+
+    def grade_submission(self, teacher_text: str, student_text: str) -> str:
         print("Grading now...")
-        grading_response = self.grader_client.responses.create(
-            model="gpt-5",
-            input=[
-                {"role": "user", "content": [{"type": "input_text", "text": grading_prompt}]}
-            ],
+        grading_input = self._grading_input(teacher_text, student_text)
+        grading_response = self._respond(
+            "grade",
+            self.grader_client,
+            self.grader_limiter,
+            self._input_estimate(grading_input),
+            model=MODEL,
+            input=grading_input,
+            prompt_cache_key=self._grading_cache_key(teacher_text),
+        )
+        return grading_response.output_text
+
+    async def agrade_submission(self, teacher_text: str, student_text: str) -> str:
+        """Async grade_submission."""
+        grading_input = self._grading_input(teacher_text, student_text)
+        grading_response = await self._arespond(
+            "grade",
+            self.async_grader_client,
+            self.grader_limiter,
+            self._input_estimate(grading_input),
+            model=MODEL,
+            input=grading_input,
+            prompt_cache_key=self._grading_cache_key(teacher_text),
         )
         return grading_response.output_text
 
+    def grade_submission_stream(self, teacher_text: str, student_text: str, on_delta: Callable[[str], None]) -> Tuple[str, Optional[int]]:
+        """
+        grade_submission with the feedback streamed to on_delta as it is
+        generated. Returns (full feedback, ms to first token).
+        """
+        grading_input = self._grading_input(teacher_text, student_text)
+        response, ttft_ms = self._respond_stream(
+            "grade",
+            self.grader_client,
+            self.grader_limiter,
+            self._input_estimate(grading_input),
+            on_delta,
+            model=MODEL,
+            input=grading_input,
+            prompt_cache_key=self._grading_cache_key(teacher_text),
+        )
+        return response.output_text, ttft_ms
+
+    async def agrade_submission_stream(self, teacher_text: str, student_text: str, on_delta: Callable[[str], Awaitable[None]]) -> Tuple[str, Optional[int]]:
+        """Async grade_submission_stream; on_delta is awaited."""
+        grading_input = self._grading_input(teacher_text, student_text)
+        response, ttft_ms = await self._arespond_stream(
+            "grade",
+            self.async_grader_client,
+            self.grader_limiter,
+            self._input_estimate(grading_input),
+            on_delta,
+            model=MODEL,
+            input=grading_input,
+            prompt_cache_key=self._grading_cache_key(teacher_text),
+        )
+        return response.output_text, ttft_ms
+
+    @staticmethod
+    def _input_estimate(input: list) -> int:
+        return sum(
+            estimate_text_tokens(part.get("text", ""))
+            for message in input
+            for part in message["content"]
+        )
+
+
+_grader: Optional[AIGrader] = None
+_grader_lock = threading.Lock()
+
+
+def get_grader(concurrency: int = 4) -> AIGrader:
+    """
+    Process-wide AIGrader, so every task reuses the same clients and warm
+    connections. `concurrency` sizes the pool on first use only.
+    """
+    global _grader
+    with _grader_lock:
+        if _grader is None:
+            _grader = AIGrader(concurrency)
+        return _grader
+
 
 if __name__ == "__main__":
     grader = AIGrader()
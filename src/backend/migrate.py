@@ -0,0 +1,161 @@
+"""
+Versioned schema migrations.
+
+Migrations are the files in migrations/ named NNNN_description.sql, applied
+in version order, each in its own transaction, and recorded in
+schema_migrations. Only one process migrates at a time (advisory lock);
+everyone else waits and then finds the schema current. A process starting
+against an up-to-date database pays a single SELECT.
+
+Versions 1-10 are the schema that used to be run on every boot, so they
+stay idempotent (IF NOT EXISTS / guarded DO blocks) for databases created
+that way. Never edit an applied migration; add a new one.
+
+    python migrate.py            apply pending migrations
+    python migrate.py --status   list applied and pending versions
+"""
+
+import hashlib
+import os
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+import psycopg2
+import psycopg2.errors
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# pg_advisory_lock key held while migrating
+MIGRATION_LOCK = 4042
+
+_MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ DEFAULT now()
+);
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode()).hexdigest()
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """All migration files in version order; duplicate versions are an error."""
+    out: Dict[int, Migration] = {}
+    for filename in os.listdir(directory):
+        match = _MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in out:
+            raise ValueError(f"Duplicate migration version {version}: {filename}")
+        with open(os.path.join(directory, filename)) as f:
+            out[version] = Migration(version, match.group(2), f.read())
+    return [out[v] for v in sorted(out)]
+
+
+def current_version(con) -> int:
+    """Highest applied version, 0 for a database never migrated."""
+    try:
+        with con:
+            with con.cursor() as cur:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+                return cur.fetchone()[0]
+    except psycopg2.errors.UndefinedTable:
+        return 0
+
+
+def _applied(cur) -> Dict[int, str]:
+    cur.execute("SELECT version, checksum FROM schema_migrations")
+    return dict(cur.fetchall())
+
+
+def migrate(con, migrations: Optional[List[Migration]] = None) -> List[int]:
+    """
+    Bring the database on `con` up to date. Returns the versions applied
+    by this call (empty when it was already current).
+    """
+    migrations = load_migrations() if migrations is None else migrations
+    if not migrations or current_version(con) >= migrations[-1].version:
+        return []
+
+    with con.cursor() as cur:
+        # Session-level lock: held across the per-migration transactions
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+    try:
+        with con:
+            with con.cursor() as cur:
+                cur.execute(VERSION_TABLE)
+                applied = _applied(cur)
+
+        done = []
+        for m in migrations:
+            if m.version in applied:
+                if applied[m.version] != m.checksum:
+                    print(f"Warning: migration {m.version}_{m.name} changed after it was applied")
+                continue
+            with con:
+                with con.cursor() as cur:
+                    cur.execute(m.sql)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                        (m.version, m.name, m.checksum),
+                    )
+            print(f"Applied migration {m.version}_{m.name}")
+            done.append(m.version)
+        return done
+    finally:
+        with con:
+            with con.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+
+
+def status(con) -> List[Dict[str, object]]:
+    """Every known migration with whether (and when) it was applied."""
+    applied_at = {}
+    if current_version(con):
+        with con:
+            with con.cursor() as cur:
+                cur.execute("SELECT version, applied_at FROM schema_migrations")
+                applied_at = dict(cur.fetchall())
+    return [
+        {
+            "version": m.version,
+            "name": m.name,
+            "applied_at": applied_at.get(m.version),
+        }
+        for m in load_migrations()
+    ]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    from db import DB
+
+    db = DB(migrate=False)
+    con = db.pool.getconn()
+    try:
+        if "--status" in sys.argv[1:]:
+            for row in status(con):
+                state = row["applied_at"] or "pending"
+                print(f"{row['version']:>4}  {row['name']:<40} {state}")
+        else:
+            applied = migrate(con)
+            print(f"Applied {len(applied)} migration(s)" if applied else "Schema is current")
+    finally:
+        db.pool.putconn(con)
+        db.close()
@@ -0,0 +1,78 @@
+-- Core tables: users, classes, assignments, files, task queues and results
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+CREATE TABLE IF NOT EXISTS users (
+    openid VARCHAR(254) PRIMARY KEY,
+    name TEXT,
+    -- Json
+    other_properites TEXT,
+    email TEXT,
+    role INT, -- UserRole
+    classes UUID[]
+);
+
+CREATE TABLE IF NOT EXISTS classes (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    owner VARCHAR(254),
+    name TEXT,
+    description TEXT,
+    
+    joinCode INT UNIQUE,
+
+    assignments UUID[]
+);
+
+CREATE TABLE IF NOT EXISTS assignments (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    name TEXT,
+    description TEXT,
+    attrs TEXT, -- JSON dict TODO
+    gradeInfo TEXT, -- JSON dict
+
+
+    context TEXT,
+    files UUID[]
+);
+
+-- All files that are in the site
+CREATE TABLE IF NOT EXISTS files (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    posted_user VARCHAR(254),
+    file_name TEXT,
+    file_role INT, -- FileRole
+    
+    file_assignment UUID,
+    context TEXT
+);
+
+CREATE TABLE IF NOT EXISTS file_cache (
+    id UUID PRIMARY KEY, -- Same as key in `files`
+    results TEXT
+);
+
+CREATE TABLE IF NOT EXISTS file_task (
+    id SERIAL PRIMARY KEY,
+    isRunning BIT,
+    task_type INT,
+    -- JSON
+    prompt_info TEXT,
+    files UUID[]
+);
+
+CREATE TABLE IF NOT EXISTS text_task (
+    id SERIAL PRIMARY KEY,
+    isRunning BIT,
+    task_type INT,
+    -- JSON
+    prompt_info TEXT,
+    texts TEXT[],
+    files UUID[]
+);
+
+CREATE TABLE IF NOT EXISTS user_results (
+    id SERIAL PRIMARY KEY,
+
+    student_copy UUID,
+    result TEXT
+);
@@ -0,0 +1,28 @@
+-- One row per (file, text task) dependency that is not in file_cache yet.
+-- Deleted by set_file_cache, which also decrements text_task.pending_deps.
+CREATE TABLE IF NOT EXISTS text_task_dep (
+    file_id UUID,
+    task_id INT REFERENCES text_task(id) ON DELETE CASCADE,
+    PRIMARY KEY (file_id, task_id)
+);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'text_task' AND column_name = 'pending_deps'
+    ) THEN
+        ALTER TABLE text_task ADD COLUMN pending_deps INT NOT NULL DEFAULT 0;
+
+        -- Backfill dependencies of tasks queued before the column existed
+        INSERT INTO text_task_dep (file_id, task_id)
+        SELECT DISTINCT f, t.id
+        FROM text_task t, unnest(t.files) f
+        WHERE NOT EXISTS (SELECT 1 FROM file_cache fc WHERE fc.id = f);
+
+        UPDATE text_task t
+        SET pending_deps = d.n
+        FROM (SELECT task_id, COUNT(*) AS n FROM text_task_dep GROUP BY task_id) d
+        WHERE t.id = d.task_id;
+    END IF;
+END $$;
@@ -0,0 +1,30 @@
+-- Claims are leases: a runner owns a task until lease_expires, and must
+-- heartbeat to keep it.  Expired leases are requeued by reclaim_expired_leases.
+ALTER TABLE file_task ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE file_task ADD COLUMN IF NOT EXISTS lease_expires TIMESTAMPTZ;
+ALTER TABLE text_task ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE text_task ADD COLUMN IF NOT EXISTS lease_expires TIMESTAMPTZ;
+
+-- Retry bookkeeping: attempts is bumped on every claim, and a failed task
+-- is not claimable again until not_before (exponential backoff).
+ALTER TABLE file_task ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;
+ALTER TABLE file_task ADD COLUMN IF NOT EXISTS not_before TIMESTAMPTZ;
+ALTER TABLE file_task ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE text_task ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;
+ALTER TABLE text_task ADD COLUMN IF NOT EXISTS not_before TIMESTAMPTZ;
+ALTER TABLE text_task ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Dead letters: tasks that ran out of attempts, with the last error
+CREATE TABLE IF NOT EXISTS failed_tasks (
+    id SERIAL PRIMARY KEY,
+    queue TEXT, -- 'file' or 'text'
+    task_id INT,
+    task_type INT,
+    -- JSON
+    prompt_info TEXT,
+    texts TEXT[],
+    files UUID[],
+    attempts INT,
+    error TEXT,
+    failed_at TIMESTAMPTZ DEFAULT now()
+);
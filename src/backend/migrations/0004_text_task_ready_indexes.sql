@@ -0,0 +1,9 @@
+-- Ready text tasks in claim order
+CREATE INDEX IF NOT EXISTS text_task_ready_idx
+    ON text_task (id)
+    WHERE isRunning = B'0' AND pending_deps = 0;
+
+-- Ready text tasks grouped by answer key (files[2]) for batched dispatch
+CREATE INDEX IF NOT EXISTS text_task_ready_key_idx
+    ON text_task ((files[2]), id)
+    WHERE isRunning = B'0' AND pending_deps = 0;
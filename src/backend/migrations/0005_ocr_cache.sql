@@ -0,0 +1,25 @@
+-- sha256 of the uploaded bytes, filled in at upload or by the runner
+ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Extracted text keyed by file content, so re-uploads of identical bytes
+-- skip the LLM OCR call. Keyed by role too since the prompts differ.
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    content_hash TEXT,
+    file_role INT, -- FileRole
+    results TEXT,
+    hits INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (content_hash, file_role)
+);
+
+-- Per page-range OCR results of a document still being extracted, so a
+-- retry only re-runs the ranges that failed. Cleared once the whole
+-- document lands in ocr_cache.
+CREATE TABLE IF NOT EXISTS ocr_chunk_cache (
+    content_hash TEXT,
+    file_role INT, -- FileRole
+    first_page INT,
+    last_page INT,
+    results TEXT,
+    PRIMARY KEY (content_hash, file_role, first_page, last_page)
+);
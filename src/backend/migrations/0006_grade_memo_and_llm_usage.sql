@@ -0,0 +1,21 @@
+-- Finished gradings keyed by input hashes and prompt version, so identical
+-- re-runs (re-uploads, requeues, duplicate tasks) skip the model.
+CREATE TABLE IF NOT EXISTS grade_memo (
+    teacher_hash TEXT,
+    student_hash TEXT,
+    prompt_version INT,
+    result TEXT,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (teacher_hash, student_hash, prompt_version)
+);
+
+-- Token accounting for every model call, including prompt-cache hits
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id SERIAL PRIMARY KEY,
+    purpose TEXT, -- teacher_ocr, student_ocr, grade, ...
+    model TEXT,
+    input_tokens INT,
+    cached_tokens INT,
+    output_tokens INT,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
@@ -0,0 +1,13 @@
+-- OpenAI file ids of uploaded PDFs by content hash, per API key (an upload
+-- is only visible to the key that made it), so retries and regrades of the
+-- same bytes skip the upload. Rows past expires_at are garbage-collected.
+CREATE TABLE IF NOT EXISTS provider_files (
+    content_hash TEXT,
+    key_name TEXT,
+    file_id TEXT NOT NULL,
+    size_bytes BIGINT,
+    hits INT NOT NULL DEFAULT 0,
+    expires_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (content_hash, key_name)
+);
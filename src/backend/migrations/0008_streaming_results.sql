@@ -0,0 +1,7 @@
+-- Streamed gradings are appended to their row as they are generated:
+-- status stays 'streaming' until finalize_user_result sets the full text
+-- and 'complete' in one statement ('failed' if generation died).
+ALTER TABLE user_results ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'complete';
+ALTER TABLE user_results ADD COLUMN IF NOT EXISTS ttft_ms INT; -- model time to first token
+ALTER TABLE user_results ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ DEFAULT now();
+ALTER TABLE user_results ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ;
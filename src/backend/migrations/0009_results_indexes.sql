@@ -0,0 +1,8 @@
+-- Results lookups: a student's files on an assignment, every submission
+-- of an assignment (gradebook), and the newest result of each file
+CREATE INDEX IF NOT EXISTS files_assignment_user_idx
+    ON files (file_assignment, posted_user);
+CREATE INDEX IF NOT EXISTS files_assignment_role_user_idx
+    ON files (file_assignment, file_role, posted_user);
+CREATE INDEX IF NOT EXISTS user_results_student_copy_idx
+    ON user_results (student_copy, id);
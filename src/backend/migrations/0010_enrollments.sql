@@ -0,0 +1,43 @@
+-- Class membership and class -> assignment links as join tables. They
+-- replace the users.classes and classes.assignments arrays, which are
+-- copied over once and no longer written.
+DO $$
+BEGIN
+    IF to_regclass('enrollments') IS NULL THEN
+        CREATE TABLE enrollments (
+            user_id VARCHAR(254) REFERENCES users(openid) ON DELETE CASCADE,
+            class_id UUID REFERENCES classes(id) ON DELETE CASCADE,
+            joined_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (user_id, class_id)
+        );
+
+        INSERT INTO enrollments (user_id, class_id, joined_at)
+        SELECT u.openid, c.id, now() + m.ord * interval '1 microsecond'
+        FROM users u
+        CROSS JOIN LATERAL unnest(u.classes) WITH ORDINALITY AS m(class_id, ord)
+        JOIN classes c ON c.id = m.class_id
+        ON CONFLICT DO NOTHING;
+    END IF;
+
+    IF to_regclass('class_assignments') IS NULL THEN
+        CREATE TABLE class_assignments (
+            class_id UUID REFERENCES classes(id) ON DELETE CASCADE,
+            assignment_id UUID REFERENCES assignments(id) ON DELETE CASCADE,
+            added_at TIMESTAMPTZ DEFAULT now(),
+            PRIMARY KEY (class_id, assignment_id)
+        );
+
+        INSERT INTO class_assignments (class_id, assignment_id, added_at)
+        SELECT c.id, a.id, now() + m.ord * interval '1 microsecond'
+        FROM classes c
+        CROSS JOIN LATERAL unnest(c.assignments) WITH ORDINALITY AS m(assignment_id, ord)
+        JOIN assignments a ON a.id = m.assignment_id
+        ON CONFLICT DO NOTHING;
+    END IF;
+END $$;
+
+-- Rosters (who is in a class) and assignment -> class lookups
+CREATE INDEX IF NOT EXISTS enrollments_class_idx
+    ON enrollments (class_id, user_id);
+CREATE INDEX IF NOT EXISTS class_assignments_assignment_idx
+    ON class_assignments (assignment_id);
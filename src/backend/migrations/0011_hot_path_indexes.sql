@@ -0,0 +1,25 @@
+-- Hot-path index set. files (file_assignment, posted_user) and
+-- user_results (student_copy, id) already exist (0009); these cover the
+-- task queues and the per-file status lookups.
+
+-- Queued file tasks in claim order (dequeue_file_tasks)
+CREATE INDEX IF NOT EXISTS file_task_ready_idx
+    ON file_task (id)
+    WHERE isRunning = B'0';
+
+-- Running tasks by lease expiry (reclaim_expired_leases)
+CREATE INDEX IF NOT EXISTS file_task_lease_idx
+    ON file_task (lease_expires)
+    WHERE isRunning = B'1';
+CREATE INDEX IF NOT EXISTS text_task_lease_idx
+    ON text_task (lease_expires)
+    WHERE isRunning = B'1';
+
+-- Tasks by the file they work on (get_submission_states): any file of an
+-- OCR task, the student copy (files[1]) of a grading task
+CREATE INDEX IF NOT EXISTS file_task_files_idx
+    ON file_task USING gin (files);
+CREATE INDEX IF NOT EXISTS text_task_student_idx
+    ON text_task ((files[1]));
+CREATE INDEX IF NOT EXISTS failed_tasks_student_idx
+    ON failed_tasks ((files[1]));
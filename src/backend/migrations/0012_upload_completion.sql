@@ -0,0 +1,13 @@
+-- Set once a file's upload has been accepted and its OCR/grading queued,
+-- so a repeated completion callback does not queue the work again.
+ALTER TABLE files ADD COLUMN IF NOT EXISTS uploaded_at TIMESTAMPTZ;
+
+-- Files already processed or in the queues before this column existed
+UPDATE files f
+SET uploaded_at = now()
+WHERE uploaded_at IS NULL
+  AND (
+      EXISTS (SELECT 1 FROM file_cache c WHERE c.id = f.id)
+      OR EXISTS (SELECT 1 FROM file_task t WHERE t.files && ARRAY[f.id])
+      OR EXISTS (SELECT 1 FROM failed_tasks ft WHERE ft.files[1] = f.id)
+  );
@@ -0,0 +1,14 @@
+-- OCR output is keyed by the pipeline that produced it (prompts, text
+-- layer use, page ranges), as grade_memo is by prompt version. Rows from
+-- before the key existed cannot be attributed to a pipeline; drop them.
+DELETE FROM ocr_cache;
+DELETE FROM ocr_chunk_cache;
+
+ALTER TABLE ocr_cache ADD COLUMN pipeline_version TEXT NOT NULL;
+ALTER TABLE ocr_cache DROP CONSTRAINT ocr_cache_pkey;
+ALTER TABLE ocr_cache ADD PRIMARY KEY (content_hash, file_role, pipeline_version);
+
+ALTER TABLE ocr_chunk_cache ADD COLUMN pipeline_version TEXT NOT NULL;
+ALTER TABLE ocr_chunk_cache DROP CONSTRAINT ocr_chunk_cache_pkey;
+ALTER TABLE ocr_chunk_cache
+    ADD PRIMARY KEY (content_hash, file_role, pipeline_version, first_page, last_page);
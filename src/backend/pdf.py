@@ -0,0 +1,152 @@
+import io
+import re
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from pypdf import PdfReader, PdfWriter
+
+# A page's embedded text layer is trusted (and the LLM skipped) when it has
+# at least this much text and looks like real words rather than glyph junk.
+MIN_PAGE_CHARS = 200
+MIN_PRINTABLE_RATIO = 0.95
+MIN_WORD_RATIO = 0.5
+
+# Raw PDF bytes or a seekable binary file object holding them
+PdfSource = Union[bytes, BinaryIO]
+
+_WORD = re.compile(r"^[^\W\d_]{2,}[.,;:!?)]*$")
+_UNMAPPED_GLYPH = re.compile(r"\(cid:\d+\)|�")
+
+
+def _reader(source: PdfSource) -> PdfReader:
+    if isinstance(source, (bytes, bytearray)):
+        return PdfReader(io.BytesIO(source))
+    source.seek(0)
+    return PdfReader(source)
+
+
+def page_count(source: PdfSource) -> int:
+    return len(_reader(source).pages)
+
+
+def _sub_pdf(reader: PdfReader, start: int, end: int) -> bytes:
+    writer = PdfWriter()
+    for i in range(start, end):
+        writer.add_page(reader.pages[i])
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def extract_text_layer(reader: PdfReader) -> List[str]:
+    """Embedded text of every page ('' for pages without a text layer)."""
+    out = []
+    for page in reader.pages:
+        try:
+            out.append(page.extract_text() or "")
+        except Exception:
+            out.append("")
+    return out
+
+
+def is_usable_text(text: str) -> bool:
+    """
+    Judge whether a page's text layer is good enough to replace OCR: enough
+    characters, almost all printable, no unmapped glyphs, mostly real words.
+    Scans and handwriting have no (or a junk) text layer and fail this.
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_PAGE_CHARS or _UNMAPPED_GLYPH.search(stripped):
+        return False
+    printable = sum(1 for c in stripped if c.isprintable() or c.isspace())
+    if printable / len(stripped) < MIN_PRINTABLE_RATIO:
+        return False
+    tokens = stripped.split()
+    words = sum(1 for t in tokens if _WORD.match(t))
+    return words / len(tokens) >= MIN_WORD_RATIO
+
+
+def _has_images(resources, depth: int = 0) -> bool:
+    """Image XObjects in `resources`, looking inside form XObjects too."""
+    if resources is None or depth > 4:
+        return False
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return False
+    for ref in xobjects.get_object().values():
+        xobj = ref.get_object()
+        subtype = xobj.get("/Subtype")
+        if subtype == "/Image":
+            return True
+        if subtype == "/Form" and _has_images(xobj.get("/Resources"), depth + 1):
+            return True
+    return False
+
+
+def has_non_text_content(page) -> bool:
+    """
+    Whether a page carries content its text layer does not: annotations
+    (ink, comments, filled form widgets) or embedded images such as
+    scanned or pasted-in handwriting.
+    """
+    annots = page.get("/Annots")
+    if annots is not None and len(annots.get_object()) > 0:
+        return True
+    return _has_images(page.get("/Resources"))
+
+
+def plan_pages(
+    source: PdfSource, pages_per_chunk: int, use_text_layer: bool = True
+) -> List[Tuple[int, int, Optional[PdfSource], Optional[str]]]:
+    """
+    Split a PDF into page ranges, in document order, as
+    (first_page, last_page, pdf_bytes, local_text) with 1-based inclusive
+    page numbers. Runs of pages with a usable text layer and nothing else
+    on them (no annotations, images or form fields) come back with
+    local_text set and no PDF; every other range is a standalone PDF of at
+    most `pages_per_chunk` pages that still needs OCR. With
+    `use_text_layer` False every page needs OCR. A document that needs OCR
+    as a whole is handed back as `source` itself, uncopied.
+    """
+    reader = _reader(source)
+    if use_text_layer and "/AcroForm" in reader.trailer["/Root"]:
+        # Filled-in form answers live outside the page text
+        use_text_layer = False
+    if use_text_layer:
+        texts = extract_text_layer(reader)
+        usable = [
+            is_usable_text(t) and not has_non_text_content(page)
+            for t, page in zip(texts, reader.pages)
+        ]
+    else:
+        texts = [""] * len(reader.pages)
+        usable = [False] * len(texts)
+    total = len(texts)
+
+    plan = []
+    start = 0
+    while start < total:
+        end = start
+        while end < total and usable[end] == usable[start]:
+            end += 1
+        if usable[start]:
+            plan.append((start + 1, end, None, "\n\n".join(texts[start:end])))
+        elif start == 0 and end == total and total <= pages_per_chunk:
+            # Nothing to split off: send the original untouched
+            plan.append((1, total, source, None))
+        else:
+            for chunk_start in range(start, end, pages_per_chunk):
+                chunk_end = min(chunk_start + pages_per_chunk, end)
+                plan.append(
+                    (chunk_start + 1, chunk_end, _sub_pdf(reader, chunk_start, chunk_end), None)
+                )
+        start = end
+    return plan
+
+
+def merge_pages(parts: List[Tuple[int, int, str]]) -> str:
+    """Join per-range extractions back into one document, in page order."""
+    if len(parts) == 1:
+        return parts[0][2]
+    return "\n\n".join(
+        f"--- Pages {first}-{last} ---\n{text}" for first, last, text in sorted(parts)
+    )
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+# Fallback budgets when no per-key override is set in the environment
+DEFAULT_RPM = 500
+DEFAULT_TPM = 500_000
+
+# Rough size of a model reply, reserved up front and settled afterwards
+EXPECTED_OUTPUT_TOKENS = 4_000
+# ~4 characters per token for English text
+CHARS_PER_TOKEN = 4
+# PDFs are sent as extracted text plus page images; ~1 token per 100 bytes
+# is a conservative stand-in until the real usage comes back.
+BYTES_PER_FILE_TOKEN = 100
+
+
+def estimate_text_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_file_tokens(num_bytes: int) -> int:
+    return num_bytes // BYTES_PER_FILE_TOKEN + 1
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket holding up to `per_minute` units.
+    Reservations may drive the level negative; the deficit is the time the
+    caller must wait, so callers are served in reservation order.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` units; returns seconds until they are really available."""
+        self._refill(now)
+        self.level -= amount
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, delta: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.capacity, self.level + delta)
+
+
+class RateLimiter:
+    """
+    Client-side requests/min and tokens/min budget for one API key.
+    Calls wait for capacity instead of being sent and bounced with a 429.
+    Safe to share between threads and an event loop.
+    """
+
+    def __init__(self, name: str, rpm: Optional[int], tpm: Optional[int]):
+        self.name = name
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+
+    @classmethod
+    def from_env(cls, key_env: str) -> "RateLimiter":
+        """
+        Budgets come from `<key_env>_rpm` / `<key_env>_tpm`, e.g.
+        grader_api_key_tpm=800000. A value of 0 disables that budget.
+        """
+        rpm = int(os.getenv(f"{key_env}_rpm", DEFAULT_RPM))
+        tpm = int(os.getenv(f"{key_env}_tpm", DEFAULT_TPM))
+        return cls(key_env, rpm, tpm)
+
+    def _reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                # A single call larger than the whole budget can never fit;
+                # charge it the full bucket so it waits for one clean minute.
+                wait = max(
+                    wait, self._tokens.reserve(min(tokens, self._tokens.capacity), now)
+                )
+        if wait > 0:
+            print(f"Rate limit {self.name}: waiting {wait:.1f}s for capacity")
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of about `tokens` tokens fits the budget."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        """Async acquire."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token budget once the real usage of a call is known."""
+        if self._tokens is None or actual is None:
+            return
+        with self._lock:
+            self._tokens.adjust(estimated - actual, time.monotonic())
@@ -1,20 +1,177 @@
 from dotenv import load_dotenv
 
 load_dotenv()
-from s3 import download_by_key
+from s3 import TRANSFER_STATS, adownload_to_buffer, content_hash, download_to_buffer
 
 from db import *
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import socket
+import threading
 import traceback
 import time
 
+from pdf import PdfSource, merge_pages, plan_pages
+
 try:
-    from grader import AIGrader
+    from grader import GRADING_PROMPT_VERSION, OCR_PIPELINE_VERSION, AIGrader, get_grader, grading_memo_key
 except ImportError:
-    from .grader import AIGrader
+    from .grader import GRADING_PROMPT_VERSION, OCR_PIPELINE_VERSION, AIGrader, get_grader, grading_memo_key
 
+# "threads" runs each task on a ThreadPoolExecutor worker; "asyncio" runs
+# up to ASYNC_WORKERS tasks as coroutines on a single event loop.
+RUNNER_MODE = os.getenv("RUNNER_MODE", "threads")
 WORKERS = 4
-from tempfile import NamedTemporaryFile
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "200"))
+# Seconds between safety-net polls when no notification arrives
+POLL_INTERVAL = 30
+# Claimed tasks are leased for LEASE_SECONDS and heartbeated every
+# LEASE_SECONDS / 3, so a task survives a couple of missed beats.
+LEASE_SECONDS = 120
+# Seconds between runs of the expired provider upload cleanup
+UPLOAD_GC_SECONDS = 600
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# PDFs are OCR'd in page ranges of this size, up to OCR_CHUNK_CONCURRENCY
+# ranges of one document at a time; a failed range is retried on its own.
+OCR_PAGES_PER_CHUNK = int(os.getenv("OCR_PAGES_PER_CHUNK", "4"))
+OCR_CHUNK_CONCURRENCY = int(os.getenv("OCR_CHUNK_CONCURRENCY", "4"))
+OCR_CHUNK_ATTEMPTS = 3
+OCR_CHUNK_RETRY_SECONDS = 5
+# Outbound model calls that can be open at once, used to size HTTP pools
+HTTP_CONCURRENCY = WORKERS * OCR_CHUNK_CONCURRENCY
+
+# Typeset answer-key pages are taken from the PDF's text layer; set
+# TEXT_LAYER_CLEANUP=1 to pass that text through a cheap model cleanup
+# instead of using it as is. Student copies always go to the model: their
+# answers are often ink, images or form fields on a typed template.
+TEXT_LAYER_CLEANUP = os.getenv("TEXT_LAYER_CLEANUP", "0") == "1"
+
+# Key of cached OCR output: the pipeline version plus the settings that
+# change what it produces, so runs with other settings never share entries
+OCR_CACHE_VERSION = (
+    f"v{OCR_PIPELINE_VERSION}-p{OCR_PAGES_PER_CHUNK}{'-clean' if TEXT_LAYER_CLEANUP else ''}"
+)
+
+# Gradings are streamed into their user_results row as they are generated,
+# appended every STREAM_FLUSH_SECONDS or STREAM_FLUSH_CHARS, whichever
+# comes first. STREAM_GRADING=0 waits for the whole reply instead.
+STREAM_GRADING = os.getenv("STREAM_GRADING", "1") == "1"
+STREAM_FLUSH_SECONDS = 1.0
+STREAM_FLUSH_CHARS = 2000
+
+# OCR cache hits/misses and how pages were read, seen by this process
+OCR_STATS = {"hits": 0, "misses": 0, "text_layer_pages": 0, "llm_pages": 0}
+_ocr_stats_lock = threading.Lock()
+
+
+def _count_ocr(stat: str, n: int = 1) -> None:
+    with _ocr_stats_lock:
+        OCR_STATS[stat] += n
+
+
+def _retry_delay(attempt: int) -> float:
+    return OCR_CHUNK_RETRY_SECONDS * 2 ** (attempt - 1)
+
+
+def ocr_pdf(db: DB, grader: AIGrader, data: PdfSource, digest: str, role: int) -> str:
+    """
+    Extract text from a PDF range by range, merging the results in page
+    order. Answer-key pages with a usable embedded text layer are read
+    locally; the rest go to the model, up to OCR_CHUNK_CONCURRENCY ranges at a time.
+    Finished model ranges are saved in ocr_chunk_cache so a retry of the
+    whole task only redoes the ranges that failed.
+    """
+    teacher = role == FileRole.TEACHER_KEY.value
+    read = grader.read_teacher_file if teacher else grader.read_student_file
+    plan = plan_pages(data, OCR_PAGES_PER_CHUNK, use_text_layer=teacher)
+    whole = len(plan) == 1
+
+    def read_range(part):
+        first, last, pdf, local = part
+        if local is not None and not TEXT_LAYER_CLEANUP:
+            _count_ocr("text_layer_pages", last - first + 1)
+            return first, last, local
+
+        out = db.get_ocr_chunk(digest, role, OCR_CACHE_VERSION, first, last)
+        if out is not None:
+            return first, last, out
+        for attempt in range(1, OCR_CHUNK_ATTEMPTS + 1):
+            try:
+                if local is not None:
+                    out = grader.clean_text(local, teacher)
+                else:
+                    out = read(pdf, None if whole else (first, last))
+                break
+            except Exception:
+                if attempt == OCR_CHUNK_ATTEMPTS:
+                    raise
+                print(f" Pages {first}-{last} failed (attempt {attempt}), retrying")
+                time.sleep(_retry_delay(attempt))
+        _count_ocr("text_layer_pages" if local is not None else "llm_pages", last - first + 1)
+        db.set_ocr_chunk(digest, role, OCR_CACHE_VERSION, first, last, out)
+        return first, last, out
+
+    if whole:
+        parts = [read_range(plan[0])]
+    else:
+        # Leaving the executor waits for every range, so the ones that
+        # succeed are saved even when another raises.
+        with ThreadPoolExecutor(max_workers=OCR_CHUNK_CONCURRENCY) as pool:
+            parts = list(pool.map(read_range, plan))
+
+    out = merge_pages(parts)
+    db.set_ocr_cache(digest, role, OCR_CACHE_VERSION, out)
+    db.delete_ocr_chunks(digest, role, OCR_CACHE_VERSION)
+    return out
+
+
+async def aocr_pdf(adb: AsyncDB, grader: AIGrader, data: PdfSource, digest: str, role: int) -> str:
+    """
+    Async ocr_pdf.
+    """
+    teacher = role == FileRole.TEACHER_KEY.value
+    read = grader.aread_teacher_file if teacher else grader.aread_student_file
+    plan = await asyncio.to_thread(
+        plan_pages, data, OCR_PAGES_PER_CHUNK, use_text_layer=teacher
+    )
+    whole = len(plan) == 1
+    limit = asyncio.Semaphore(OCR_CHUNK_CONCURRENCY)
+
+    async def read_range(part):
+        first, last, pdf, local = part
+        if local is not None and not TEXT_LAYER_CLEANUP:
+            _count_ocr("text_layer_pages", last - first + 1)
+            return first, last, local
+
+        out = await adb.get_ocr_chunk(digest, role, OCR_CACHE_VERSION, first, last)
+        if out is not None:
+            return first, last, out
+        async with limit:
+            for attempt in range(1, OCR_CHUNK_ATTEMPTS + 1):
+                try:
+                    if local is not None:
+                        out = await grader.aclean_text(local, teacher)
+                    else:
+                        out = await read(pdf, None if whole else (first, last))
+                    break
+                except Exception:
+                    if attempt == OCR_CHUNK_ATTEMPTS:
+                        raise
+                    await asyncio.sleep(_retry_delay(attempt))
+        _count_ocr("text_layer_pages" if local is not None else "llm_pages", last - first + 1)
+        await adb.set_ocr_chunk(digest, role, OCR_CACHE_VERSION, first, last, out)
+        return first, last, out
+
+    results = await asyncio.gather(*(read_range(p) for p in plan), return_exceptions=True)
+    for r in results:
+        if isinstance(r, BaseException):
+            raise r
+
+    out = merge_pages(results)
+    await adb.set_ocr_cache(digest, role, OCR_CACHE_VERSION, out)
+    await adb.delete_ocr_chunks(digest, role, OCR_CACHE_VERSION)
+    return out
+
 
 def run_file_event(db: DB, id: int, task_type: int, prompt_info: dict, files: list[str]):
     """
@@ -23,45 +180,129 @@ def run_file_event(db: DB, id: int, task_type: int, prompt_info: dict, files: li
     It loads text directly from the database cache.
     """
     print(f"Processing file event {id} with files: {files}")
-    grader = AIGrader()
+    grader = get_grader(HTTP_CONCURRENCY)
 
     # Each file in the event is referenced by its key
     initial = str(files[0])
     fileInfo = db.get_file(initial)
 
     # Determine whether this file is a teacher key or student submission
-    is_teacher = fileInfo["file_role"] == FileRole.TEACHER_KEY.value
-    is_student = fileInfo["file_role"] == FileRole.STUDENT_RESPONSE.value
-
-    #  Get preloaded text from cache instead of reading a file
+    role = fileInfo["file_role"]
+    is_teacher = role == FileRole.TEACHER_KEY.value
+    is_student = role == FileRole.STUDENT_RESPONSE.value
+    if not is_teacher and not is_student:
+        raise ValueError(f"Unknown file role for {initial}")
 
-    with NamedTemporaryFile(suffix=".pdf") as tmp:
-        tmp=tmp.name
-        download_by_key(initial, tmp)
-        print("DOING THE OCR")
+    # Identical bytes were OCR'd before: reuse the text, skipping the
+    # download too when the hash was recorded at upload.
+    digest = fileInfo["content_hash"]
+    out = db.get_ocr_cache(digest, role, OCR_CACHE_VERSION) if digest else None
+    if out is None:
+        # Normal-sized exams stay in memory end to end; only objects above
+        # SPOOL_MAX_BYTES spill to disk.
+        with download_to_buffer(initial) as buf:
+            if digest is None:
+                digest = content_hash(buf)
+                db.set_file_content_hash(initial, digest)
+                out = db.get_ocr_cache(digest, role, OCR_CACHE_VERSION)
+            _count_ocr("hits" if out is not None else "misses")
 
-        # Pass raw text directly into the grader
-        if is_teacher:
-            out = grader.read_teacher_file(tmp)
-        elif is_student:
-            out = grader.read_student_file(tmp)
-        else:
-            raise ValueError(f"Unknown file role for {initial}")
+            if out is None:
+                print("DOING THE OCR")
+                out = ocr_pdf(db, grader, buf, digest, role)
+    else:
+        _count_ocr("hits")
 
-        #  Update database state
-        db.complete_file_task(id)
-        db.set_file_cache(initial, out)
+    #  Update database state; cache first so a crash in between only
+    #  repeats the (idempotent) cache write on retry
+    db.set_file_cache(initial, out)
+    if not db.complete_file_task(id, WORKER_ID):
+        print(f"file task {id} lease was reclaimed before it finished; leaving it to the new owner")
+        return
 
     print(f" Completed file task {id} ({'teacher' if is_teacher else 'student'})")
 
 
+class ResultBuffer:
+    """
+    Collects streamed grading deltas into row appends: the first delta is
+    written at once so feedback shows up immediately, later ones in
+    batches of STREAM_FLUSH_SECONDS / STREAM_FLUSH_CHARS.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = None
+
+    def add(self, delta: str) -> Optional[str]:
+        """Buffer `delta`; returns the text to append when a flush is due."""
+        self._pending.append(delta)
+        self._pending_chars += len(delta)
+        now = time.monotonic()
+        if (
+            self._last_flush is not None
+            and now - self._last_flush < STREAM_FLUSH_SECONDS
+            and self._pending_chars < STREAM_FLUSH_CHARS
+        ):
+            return None
+        chunk = "".join(self._pending)
+        self._pending, self._pending_chars, self._last_flush = [], 0, now
+        return chunk
+
+
+def stream_grade(db: DB, grader: AIGrader, student_file: UUID, teacher_text: str, student_text: str) -> str:
+    """
+    Grade with the feedback persisted incrementally: partial text lands in
+    a 'streaming' user_results row as it is generated, and the row is
+    finalized with the full reply and time to first token at the end.
+    """
+    result_id = db.start_user_result(student_file)
+    buffer = ResultBuffer()
+
+    def on_delta(delta: str) -> None:
+        chunk = buffer.add(delta)
+        if chunk:
+            db.append_user_result(result_id, chunk)
+
+    try:
+        result, ttft_ms = grader.grade_submission_stream(teacher_text, student_text, on_delta)
+    except Exception:
+        db.fail_user_result(result_id)
+        raise
+    db.finalize_user_result(result_id, result, ttft_ms)
+    print(f" Graded {student_file} (first token after {ttft_ms} ms)")
+    return result
+
+
+async def astream_grade(adb: AsyncDB, grader: AIGrader, student_file: UUID, teacher_text: str, student_text: str) -> str:
+    """
+    Async stream_grade.
+    """
+    result_id = await adb.start_user_result(student_file)
+    buffer = ResultBuffer()
+
+    async def on_delta(delta: str) -> None:
+        chunk = buffer.add(delta)
+        if chunk:
+            await adb.append_user_result(result_id, chunk)
+
+    try:
+        result, ttft_ms = await grader.agrade_submission_stream(teacher_text, student_text, on_delta)
+    except Exception:
+        await adb.fail_user_result(result_id)
+        raise
+    await adb.finalize_user_result(result_id, result, ttft_ms)
+    return result
+
+
 def run_text_event(db: DB, id: int, task_type: int, prompt_info: dict, texts: list[str], files: list[UUID]):
     """
     Handles text-based events.
     Combines preloaded teacher + student text and runs grading.
     """
     print(f"Processing text event {id} using files: {files}")
-    grader = AIGrader()
+    grader = get_grader(HTTP_CONCURRENCY)
 
     # Load all cached file texts
     files_text = [db.get_file_cache(str(f)) for f in files]
@@ -72,40 +313,489 @@ def run_text_event(db: DB, id: int, task_type: int, prompt_info: dict, texts: li
     context_files_text = files_text[2:] if len(files_text) > 2 else []
 
     if not student_text or not teacher_text:
-        print(f" Missing student or teacher text for text event {id}")
+        raise ValueError(f"Missing student or teacher text for text event {id}")
+
+    # Identical inputs under the same prompt version were graded before
+    memo_key = grading_memo_key(teacher_text, student_text)
+    result = db.get_grade_memo(*memo_key)
+    if result is not None:
+        print(f" Reusing memoized grade for text event {id}")
+        db.add_user_result(files[0], result)
+    elif STREAM_GRADING:
+        result = stream_grade(db, grader, files[0], teacher_text, student_text)
+        db.set_grade_memo(*memo_key, result)
+    else:
+        # Run the grading logic
+        result = grader.grade_submission(teacher_text=teacher_text, student_text=student_text)
+        db.set_grade_memo(*memo_key, result)
+        db.add_user_result(files[0], result)
+
+    if not db.complete_text_task(id, WORKER_ID):
+        print(f"text task {id} lease was reclaimed before it finished; leaving it to the new owner")
+
+
+def run_task(db: DB, queue: str, event: dict):
+    """
+    Run one claimed task. On failure the task is handed back to the queue,
+    which retries it with backoff or dead-letters it after too many attempts.
+    """
+    handler = run_file_event if queue == "file" else run_text_event
+    fail = db.fail_file_task if queue == "file" else db.fail_text_task
+    try:
+        handler(db, **event)
+    except Exception:
+        error = traceback.format_exc()
+        print(f"{queue} task {event['id']} failed:\n{error}")
+        dead = fail(event["id"], error, worker_id=WORKER_ID)
+        if dead is None:
+            print(f"{queue} task {event['id']} lease was reclaimed before it failed; not requeued")
+        elif dead:
+            print(f"{queue} task {event['id']} moved to failed_tasks")
+
+
+async def arun_file_event(adb: AsyncDB, grader: AIGrader, id: int, task_type: int, prompt_info: dict, files: list[str]):
+    """
+    Async run_file_event.
+    """
+    print(f"Processing file event {id} with files: {files}")
+
+    initial = str(files[0])
+    fileInfo = await adb.get_file(initial)
+
+    role = fileInfo["file_role"]
+    is_teacher = role == FileRole.TEACHER_KEY.value
+    is_student = role == FileRole.STUDENT_RESPONSE.value
+    if not is_teacher and not is_student:
+        raise ValueError(f"Unknown file role for {initial}")
+
+    digest = fileInfo["content_hash"]
+    out = await adb.get_ocr_cache(digest, role, OCR_CACHE_VERSION) if digest else None
+    if out is None:
+        with await adownload_to_buffer(initial) as buf:
+            if digest is None:
+                digest = await asyncio.to_thread(content_hash, buf)
+                await adb.set_file_content_hash(initial, digest)
+                out = await adb.get_ocr_cache(digest, role, OCR_CACHE_VERSION)
+            _count_ocr("hits" if out is not None else "misses")
+
+            if out is None:
+                out = await aocr_pdf(adb, grader, buf, digest, role)
+    else:
+        _count_ocr("hits")
+
+    await adb.set_file_cache(initial, out)
+    if not await adb.complete_file_task(id, WORKER_ID):
+        print(f"file task {id} lease was reclaimed before it finished; leaving it to the new owner")
         return
 
-    # Run the grading logic
-    result = grader.grade_submission(student_text, teacher_text)
+    print(f" Completed file task {id} ({'teacher' if is_teacher else 'student'})")
 
-    #  Cache the result and mark complete
-    db.complete_text_task(id)
 
-    db.add_user_result(files[0], result)
+async def arun_text_event(adb: AsyncDB, grader: AIGrader, id: int, task_type: int, prompt_info: dict, texts: list[str], files: list[UUID]):
+    """
+    Async run_text_event.
+    """
+    print(f"Processing text event {id} using files: {files}")
 
+    files_text = [await adb.get_file_cache(str(f)) for f in files]
 
-def main():
+    student_text = files_text[0] if len(files_text) > 0 else None
+    teacher_text = files_text[1] if len(files_text) > 1 else None
+
+    if not student_text or not teacher_text:
+        raise ValueError(f"Missing student or teacher text for text event {id}")
+
+    memo_key = grading_memo_key(teacher_text, student_text)
+    result = await adb.get_grade_memo(*memo_key)
+    if result is not None:
+        await adb.add_user_result(files[0], result)
+    elif STREAM_GRADING:
+        result = await astream_grade(adb, grader, files[0], teacher_text, student_text)
+        await adb.set_grade_memo(*memo_key, result)
+    else:
+        result = await grader.agrade_submission(teacher_text=teacher_text, student_text=student_text)
+        await adb.set_grade_memo(*memo_key, result)
+        await adb.add_user_result(files[0], result)
+
+    if not await adb.complete_text_task(id, WORKER_ID):
+        print(f"text task {id} lease was reclaimed before it finished; leaving it to the new owner")
+
+
+async def arun_task(adb: AsyncDB, grader: AIGrader, queue: str, event: dict):
+    """
+    Async run_task.
+    """
+    handler = arun_file_event if queue == "file" else arun_text_event
+    fail = adb.fail_file_task if queue == "file" else adb.fail_text_task
+    try:
+        await handler(adb, grader, **event)
+    except Exception:
+        error = traceback.format_exc()
+        print(f"{queue} task {event['id']} failed:\n{error}")
+        dead = await fail(event["id"], error, worker_id=WORKER_ID)
+        if dead is None:
+            print(f"{queue} task {event['id']} lease was reclaimed before it failed; not requeued")
+        elif dead:
+            print(f"{queue} task {event['id']} moved to failed_tasks")
+
+
+class _SlotTracker:
+    """In-flight bookkeeping shared by the thread and asyncio schedulers."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Any, Tuple[str, int]] = {}
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+    def free_slots(self) -> int:
+        return self.workers - self.in_flight
+
+    def running(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            return list(self._in_flight.values())
+
+    def _check_slot(self, label: Tuple[str, int]) -> None:
+        """Raise unless a slot is free for `label`; call before starting work."""
+        if len(self._in_flight) >= self.workers:
+            raise RuntimeError(f"No free worker slot for {label}")
+
+    def _already_running(self, label: Tuple[str, int]) -> bool:
+        """
+        Whether `label` is still in flight here. Happens when a late
+        heartbeat let its lease expire and it was reclaimed and claimed
+        again by this runner: the running attempt keeps the (renewed) lease
+        and finishes the task, so the new claim is skipped.
+        """
+        with self._lock:
+            running = label in self._in_flight.values()
+        if running:
+            print(f"Task {label} was claimed again while still running here; skipping")
+        return running
+
+    def _track(self, handle: Any, label: Tuple[str, int]) -> None:
+        with self._lock:
+            self._check_slot(label)
+            self._in_flight[handle] = label
+
+    def _untrack(self, handle: Any) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            return self._in_flight.pop(handle, None)
+
+
+class TaskScheduler(_SlotTracker):
+    """
+    Bounded front for a ThreadPoolExecutor.
+    Work is only claimed while a worker slot is free, so claimed tasks never
+    sit in the executor's internal queue, and finished futures are dropped
+    as soon as they complete.
+    """
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slot_freed = threading.Event()
+
+    def submit(self, label: Tuple[str, int], fn, *args, **kwargs) -> Optional[Future]:
+        """Run fn on a free worker; None if `label` is already running."""
+        if self._already_running(label):
+            return None
+        with self._lock:
+            self._check_slot(label)
+        self._slot_freed.clear()
+        fut = self._executor.submit(fn, *args, **kwargs)
+        self._track(fut, label)
+        fut.add_done_callback(self._on_done)
+        return fut
+
+    def _on_done(self, fut: Future) -> None:
+        label = self._untrack(fut)
+        if fut.exception():
+            print(f"Task {label} failed")
+            traceback.print_exception(fut.exception())
+        self._slot_freed.set()
+
+    def wait_for_slot(self, timeout: float) -> bool:
+        """Block until a worker slot frees up or `timeout` seconds pass."""
+        if self.free_slots() > 0:
+            return True
+        return self._slot_freed.wait(timeout)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+class AsyncTaskScheduler(_SlotTracker):
+    """
+    asyncio counterpart of TaskScheduler: each claimed task runs as a
+    coroutine on the event loop, bounded by `workers` concurrent tasks.
+    """
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self._slot_freed = asyncio.Event()
+
+    def submit(self, label: Tuple[str, int], coro) -> Optional[asyncio.Task]:
+        """Run coro as a task; None (coro closed) if `label` is already running."""
+        if self._already_running(label):
+            coro.close()
+            return None
+        # Check before create_task: a task that starts and then fails to be
+        # tracked would run with no slot accounted for it
+        try:
+            with self._lock:
+                self._check_slot(label)
+        except RuntimeError:
+            coro.close()
+            raise
+        self._slot_freed.clear()
+        # Nothing can claim a slot between the check and here: submit only
+        # runs on the event loop and does not yield
+        task = asyncio.create_task(coro)
+        self._track(task, label)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        label = self._untrack(task)
+        if not task.cancelled() and task.exception():
+            print(f"Task {label} failed")
+            traceback.print_exception(task.exception())
+        self._slot_freed.set()
+
+    async def wait_for_slot(self, timeout: float) -> bool:
+        if self.free_slots() > 0:
+            return True
+        try:
+            await asyncio.wait_for(self._slot_freed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def shutdown(self) -> None:
+        with self._lock:
+            tasks = list(self._in_flight)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class LeaseKeeper(threading.Thread):
+    """
+    Background heartbeat: extends the leases on everything the scheduler has
+    in flight, and requeues tasks whose lease expired on any runner. Does
+    nothing but database work, so a beat never outlasts a lease.
+    """
+
+    def __init__(self, db: DB, scheduler: _SlotTracker):
+        super().__init__(daemon=True)
+        self.db = db
+        self.scheduler = scheduler
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop.wait(LEASE_SECONDS / 3):
+            try:
+                self.beat()
+            except Exception:
+                traceback.print_exc()
+
+    def beat(self) -> None:
+        running = self.scheduler.running()
+        file_ids = [i for kind, i in running if kind == "file"]
+        text_ids = [i for kind, i in running if kind == "text"]
+
+        kept = {
+            ("file", i)
+            for i in self.db.heartbeat_file_tasks(WORKER_ID, file_ids, LEASE_SECONDS)
+        } | {
+            ("text", i)
+            for i in self.db.heartbeat_text_tasks(WORKER_ID, text_ids, LEASE_SECONDS)
+        }
+        for label in running:
+            if label not in kept:
+                print(f"Lost lease on {label}; it may be picked up by another runner")
+
+        reclaimed = self.db.reclaim_expired_leases()
+        if any(reclaimed):
+            print(f"Reclaimed expired leases (file, text): {reclaimed}")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class UploadCollector(threading.Thread):
+    """
+    Deletes expired provider file uploads every UPLOAD_GC_SECONDS, a
+    bounded batch per run. Kept off the heartbeat thread because each
+    deletion is a provider call that can be slow.
+    """
+
+    def __init__(self, grader: AIGrader):
+        super().__init__(daemon=True)
+        self.grader = grader
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop.wait(UPLOAD_GC_SECONDS):
+            try:
+                collected = self.grader.delete_expired_uploads()
+                if collected:
+                    print(f"Deleted {collected} expired file uploads")
+            except Exception:
+                traceback.print_exc()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def thread_main():
     db = DB()
-    print("Starting event runner")
+    listener = db.listen([FILE_TASK_CHANNEL, TEXT_TASK_CHANNEL])
+    scheduler = TaskScheduler(WORKERS)
+    grader = get_grader(HTTP_CONCURRENCY)
+    grader.usage_sink = db.record_llm_usage
+    grader.file_registry = db
+    leases = LeaseKeeper(db, scheduler)
+    uploads = UploadCollector(grader)
+    print(f"Starting event runner {WORKER_ID} (threads)")
+
+    # Requeue whatever a crashed runner left behind before claiming new work
+    leases.beat()
+    leases.start()
+    uploads.start()
+    db.evict_grade_memo(GRADING_PROMPT_VERSION)
+    db.evict_ocr_cache(OCR_CACHE_VERSION)
 
-    with ThreadPoolExecutor(max_workers=WORKERS) as exec:
-        futures = []
+    try:
+        last_in_flight = -1
         while True:
-            file_event = db.dequeue_file_task()
-            text_event = db.dequeue_text_task()
+            # Drain everything claimable before going back to sleep, claiming
+            # only as many tasks as there are idle workers.
+            while True:
+                free = scheduler.free_slots()
+                if free <= 0:
+                    break
 
+                file_events = db.dequeue_file_tasks(free, WORKER_ID, LEASE_SECONDS)
+                text_events = db.dequeue_text_tasks(
+                    free - len(file_events), WORKER_ID, LEASE_SECONDS
+                )
 
-            if file_event is not None:
-                futures.append(exec.submit(run_file_event, db, **file_event))
+                for file_event in file_events:
+                    scheduler.submit(
+                        ("file", file_event["id"]), run_task, db, "file", file_event
+                    )
 
-            if text_event is not None:
-                futures.append(exec.submit(run_text_event, db, **text_event))
+                for text_event in text_events:
+                    scheduler.submit(
+                        ("text", text_event["id"]), run_task, db, "text", text_event
+                    )
 
-            # Wait for all tasks to finish
-            for fut in futures:
-                if not fut.running() and fut.exception():
-                    traceback.print_exception(fut.exception())
-            time.sleep(1)
+                if not file_events and not text_events:
+                    break
+
+            in_flight = scheduler.in_flight
+            if in_flight != last_in_flight:
+                print(
+                    f"In flight: {in_flight}/{WORKERS} {scheduler.running()}"
+                    f" http: {grader.stats.snapshot()}"
+                    f" uploads: {grader.upload_stats.snapshot()}"
+                    f" s3: {TRANSFER_STATS.snapshot()}"
+                    f" ocr: {OCR_STATS}"
+                )
+                last_in_flight = in_flight
+
+            if scheduler.free_slots() <= 0:
+                # Saturated: notifications queue up on the listener socket
+                # and are picked up once a slot frees.
+                scheduler.wait_for_slot(POLL_INTERVAL)
+            else:
+                # Block until an enqueue/file cache write wakes us up; the
+                # timeout is only a safety net for missed notifications.
+                db.wait_for_notify(listener, POLL_INTERVAL)
+    finally:
+        leases.stop()
+        uploads.stop()
+        scheduler.shutdown()
+
+
+async def async_main():
+    db = DB()
+    adb = AsyncDB(db)
+    grader = get_grader(ASYNC_WORKERS)
+    grader.usage_sink = db.record_llm_usage
+    grader.file_registry = db
+    listener = db.listen([FILE_TASK_CHANNEL, TEXT_TASK_CHANNEL])
+    scheduler = AsyncTaskScheduler(ASYNC_WORKERS)
+    leases = LeaseKeeper(db, scheduler)
+    uploads = UploadCollector(grader)
+    print(f"Starting event runner {WORKER_ID} (asyncio)")
+
+    await adb.reclaim_expired_leases()
+    leases.start()
+    uploads.start()
+    await adb.evict_grade_memo(GRADING_PROMPT_VERSION)
+    await adb.evict_ocr_cache(OCR_CACHE_VERSION)
+
+    try:
+        last_in_flight = -1
+        while True:
+            while True:
+                free = scheduler.free_slots()
+                if free <= 0:
+                    break
+
+                file_events = await adb.dequeue_file_tasks(free, WORKER_ID, LEASE_SECONDS)
+                text_events = await adb.dequeue_text_tasks(
+                    free - len(file_events), WORKER_ID, LEASE_SECONDS
+                )
+
+                for file_event in file_events:
+                    scheduler.submit(
+                        ("file", file_event["id"]),
+                        arun_task(adb, grader, "file", file_event),
+                    )
+
+                for text_event in text_events:
+                    scheduler.submit(
+                        ("text", text_event["id"]),
+                        arun_task(adb, grader, "text", text_event),
+                    )
+
+                if not file_events and not text_events:
+                    break
+
+            in_flight = scheduler.in_flight
+            if in_flight != last_in_flight:
+                print(
+                    f"In flight: {in_flight}/{ASYNC_WORKERS}"
+                    f" http: {grader.stats.snapshot()}"
+                    f" uploads: {grader.upload_stats.snapshot()}"
+                    f" s3: {TRANSFER_STATS.snapshot()}"
+                    f" ocr: {OCR_STATS}"
+                )
+                last_in_flight = in_flight
+
+            if scheduler.free_slots() <= 0:
+                await scheduler.wait_for_slot(POLL_INTERVAL)
+            else:
+                await adb.wait_for_notify(listener, POLL_INTERVAL)
+    finally:
+        leases.stop()
+        uploads.stop()
+        await scheduler.shutdown()
+
+
+def main():
+    if RUNNER_MODE == "asyncio":
+        asyncio.run(async_main())
+    elif RUNNER_MODE == "threads":
+        thread_main()
+    else:
+        raise ValueError(f"Unknown RUNNER_MODE {RUNNER_MODE!r}")
 
 
 if __name__ == "__main__":
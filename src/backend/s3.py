@@ -1,4 +1,15 @@
+import asyncio
+import hashlib
+import io
+import math
+import threading
+import time
+from collections import OrderedDict
 import boto3, os
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
 
 s3 = boto3.client(
     "s3",
@@ -10,30 +21,365 @@ s3 = boto3.client(
 
 BUCKET = "pdf-stasher"
 
+# Presigned GETs are cached and reused while at least this many seconds of
+# their lifetime remain
+DOWNLOAD_URL_MIN_REMAINING = 600
 
+# Direct browser uploads: presigned PUT lifetime and the largest PDF the
+# completion endpoint accepts
+UPLOAD_URL_EXPIRY = 900
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 500 * 1024 * 1024))
 
-def generate_download_url(key, expiry_seconds=3600):
-    return s3.generate_presigned_url(
+# Downloads larger than this spool to disk instead of staying in memory
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", 32 * 1024 * 1024))
+
+# Objects above one part are moved as parallel multipart uploads / ranged
+# GETs of S3_PART_SIZE bytes, S3_TRANSFER_CONCURRENCY at a time.
+PART_SIZE = int(os.getenv("S3_PART_SIZE", 16 * 1024 * 1024))
+TRANSFER_CONCURRENCY = int(os.getenv("S3_TRANSFER_CONCURRENCY", 8))
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=PART_SIZE,
+    multipart_chunksize=PART_SIZE,
+    max_concurrency=TRANSFER_CONCURRENCY,
+    use_threads=True,
+)
+
+
+class TransferStats:
+    """Bytes moved and wall time per direction, for throughput reporting."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, direction, nbytes, seconds):
+        with self._lock:
+            count, total, elapsed = self._totals.get(direction, (0, 0, 0.0))
+            self._totals[direction] = (count + 1, total + nbytes, elapsed + seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                direction: {
+                    "transfers": count,
+                    "bytes": total,
+                    "mb_per_s": round(total / elapsed / 1e6, 2) if elapsed else None,
+                }
+                for direction, (count, total, elapsed) in self._totals.items()
+            }
+
+
+TRANSFER_STATS = TransferStats()
+
+
+
+class PresignedUrlCache:
+    """
+    Process-local LRU of presigned GET URLs with their expiry time. A URL
+    is only handed out again while at least `min_remaining` seconds of its
+    lifetime are left, so clients never get one about to lapse.
+    """
+
+    def __init__(self, max_entries, min_remaining):
+        self.max_entries = max_entries
+        self.min_remaining = min_remaining
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (key, expiry_seconds) -> (url, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, expiry_seconds):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((key, expiry_seconds))
+            if entry is None or entry[1] - now < self.min_remaining:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((key, expiry_seconds))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, expiry_seconds, url, signed_at):
+        with self._lock:
+            self._entries[(key, expiry_seconds)] = (url, signed_at + expiry_seconds)
+            self._entries.move_to_end((key, expiry_seconds))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+DOWNLOAD_URL_CACHE = PresignedUrlCache(
+    max_entries=int(os.getenv("DOWNLOAD_URL_CACHE_SIZE", 10_000)),
+    min_remaining=DOWNLOAD_URL_MIN_REMAINING,
+)
+
+
+def _sign_download_url(key, expiry_seconds):
+    signed_at = time.time()
+    url = s3.generate_presigned_url(
         ClientMethod="get_object",
         Params={"Bucket": BUCKET, "Key": key},
         ExpiresIn=expiry_seconds,
     )
+    DOWNLOAD_URL_CACHE.put(key, expiry_seconds, url, signed_at)
+    return url
 
-def generate_upload_url(key, expiry_seconds=3600):
 
+def generate_download_url(key, expiry_seconds=3600):
+    """Presigned GET for `key`, reusing a cached one with enough life left."""
+    if expiry_seconds <= DOWNLOAD_URL_MIN_REMAINING:
+        # Too short-lived to ever be reused
+        return s3.generate_presigned_url(
+            ClientMethod="get_object",
+            Params={"Bucket": BUCKET, "Key": key},
+            ExpiresIn=expiry_seconds,
+        )
+    url = DOWNLOAD_URL_CACHE.get(key, expiry_seconds)
+    return url if url is not None else _sign_download_url(key, expiry_seconds)
+
+
+def generate_download_urls(keys, expiry_seconds=3600):
+    """
+    {key: presigned GET} for a listing page. Cached URLs are reused and
+    only the rest are signed, each distinct key once.
+    """
+    return {key: generate_download_url(key, expiry_seconds) for key in dict.fromkeys(keys)}
+
+def generate_upload_url(key, expiry_seconds=3600, content_type=None):
+    """
+    Presigned PUT for a browser to upload straight to the bucket. When
+    `content_type` is given it is part of the signature, so the client
+    must send the same Content-Type header.
+    """
+    params = {"Bucket": BUCKET, "Key": key}
+    if content_type is not None:
+        params["ContentType"] = content_type
     return s3.generate_presigned_url(
         ClientMethod="put_object",
-        Params={"Bucket": BUCKET, "Key": key},
+        Params=params,
         ExpiresIn=expiry_seconds,
     )
 
 
-    
+def head_object(key):
+    """
+    Size, type and ETag of an uploaded object without fetching it, or
+    None when nothing was uploaded under `key`.
+    """
+    try:
+        head = s3.head_object(Bucket=BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return {
+        "size": head["ContentLength"],
+        "content_type": head.get("ContentType"),
+        "etag": head.get("ETag", "").strip('"'),
+    }
+
 
 def download_by_key(key, destination_path):
     """
     Downloads a file from S3 using the specified key and writes it
     to the given local destination path.
     """
-    s3.download_file(BUCKET, key, destination_path)
+    start = time.monotonic()
+    s3.download_file(BUCKET, key, destination_path, Config=TRANSFER_CONFIG)
+    TRANSFER_STATS.record("download", os.path.getsize(destination_path), time.monotonic() - start)
     return destination_path
+
+
+def download_to_buffer(key, max_memory=None):
+    """
+    Stream an object into a SpooledTemporaryFile: held in memory up to
+    `max_memory` bytes (SPOOL_MAX_BYTES by default), spilled to disk only
+    above that. Objects over PART_SIZE are fetched as parallel ranged GETs.
+    Returned rewound; close it (or use `with`) when done.
+    """
+    buf = SpooledTemporaryFile(max_size=max_memory or SPOOL_MAX_BYTES)
+    start = time.monotonic()
+    try:
+        s3.download_fileobj(BUCKET, key, buf, Config=TRANSFER_CONFIG)
+    except Exception:
+        buf.close()
+        raise
+    # Ranged parts are written with seek+write in whatever order they
+    # finish, so tell() is not the size; the end of the buffer is
+    buf.seek(0, io.SEEK_END)
+    size = buf.tell()
+    TRANSFER_STATS.record("download", size, time.monotonic() - start)
+    buf.seek(0)
+    return buf
+
+
+async def adownload_to_buffer(key, max_memory=None):
+    """
+    Async download_to_buffer. boto3 is blocking, so the transfer runs on
+    the default executor while the event loop keeps serving other tasks.
+    """
+    return await asyncio.to_thread(download_to_buffer, key, max_memory)
+
+
+# -----------------------
+# Multipart uploads
+# -----------------------
+def _pending_upload_ids(key):
+    """Ids of unfinished multipart uploads to `key`."""
+    res = s3.list_multipart_uploads(Bucket=BUCKET, Prefix=key)
+    return [u["UploadId"] for u in res.get("Uploads", []) if u["Key"] == key]
+
+
+def _abort_pending_uploads(key, keep=None):
+    """Abort every unfinished multipart upload to `key` except `keep`."""
+    for upload_id in _pending_upload_ids(key):
+        if upload_id != keep:
+            s3.abort_multipart_upload(Bucket=BUCKET, Key=key, UploadId=upload_id)
+
+
+def _open_multipart_upload(key, resume_id=None):
+    """
+    (upload id, parts already uploaded). Resumes `resume_id` when it is
+    still pending for `key`; any other unfinished upload to the key is
+    aborted, since its parts may hold a different file's bytes.
+    """
+    pending = _pending_upload_ids(key)
+    if resume_id is not None and resume_id in pending:
+        _abort_pending_uploads(key, keep=resume_id)
+        return resume_id, _uploaded_parts(key, resume_id)
+    _abort_pending_uploads(key)
+    upload_id = s3.create_multipart_upload(
+        Bucket=BUCKET, Key=key, ContentType="application/pdf"
+    )["UploadId"]
+    return upload_id, {}
+
+
+def _uploaded_parts(key, upload_id):
+    """{part number: (etag, size)} of parts S3 already holds."""
+    parts = {}
+    for page in s3.get_paginator("list_parts").paginate(
+        Bucket=BUCKET, Key=key, UploadId=upload_id
+    ):
+        for part in page.get("Parts", []):
+            parts[part["PartNumber"]] = (part["ETag"], part["Size"])
+    return parts
+
+
+def complete_multipart_upload(key, upload_id, part_count=None):
+    """
+    Stitch the uploaded parts into the final object. Parts must be
+    numbered 1..n without gaps; S3's own part list is authoritative, so
+    callers do not need to collect ETags. With `part_count`, only parts
+    1..part_count are used and any beyond it are discarded.
+    """
+    parts = _uploaded_parts(key, upload_id)
+    if part_count is not None:
+        parts = {n: p for n, p in parts.items() if n <= part_count}
+        expected = list(range(1, part_count + 1))
+    else:
+        expected = list(range(1, len(parts) + 1))
+    if not parts or sorted(parts) != expected:
+        raise ValueError(f"Multipart upload {upload_id} is missing parts")
+    s3.complete_multipart_upload(
+        Bucket=BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": n, "ETag": etag} for n, (etag, _) in sorted(parts.items())
+            ]
+        },
+    )
+
+
+def upload_stream(fileobj, key, part_size=None, concurrency=None):
+    """
+    Upload a seekable file object to `key`. Anything over one part goes up
+    as parallel multipart parts; an unfinished multipart upload to the same
+    key is resumed, re-sending every part S3 does not hold with the same
+    bytes (by ETag, the part's MD5). A failed upload is left open so the
+    next call can resume it.
+    """
+    part_size = part_size or PART_SIZE
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    start = time.monotonic()
+
+    if size <= part_size:
+        s3.upload_fileobj(fileobj, BUCKET, key, Config=TRANSFER_CONFIG)
+        TRANSFER_STATS.record("upload", size, time.monotonic() - start)
+        return
+
+    pending = _pending_upload_ids(key)
+    upload_id, done = _open_multipart_upload(key, pending[0] if pending else None)
+
+    count = math.ceil(size / part_size)
+    read_lock = threading.Lock()
+
+    def send(number):
+        offset = (number - 1) * part_size
+        length = min(part_size, size - offset)
+        with read_lock:
+            fileobj.seek(offset)
+            data = fileobj.read(length)
+        if number in done and done[number][0].strip('"') == hashlib.md5(data).hexdigest():
+            return 0
+        s3.upload_part(
+            Bucket=BUCKET, Key=key, UploadId=upload_id, PartNumber=number, Body=data
+        )
+        return length
+
+    with ThreadPoolExecutor(max_workers=concurrency or TRANSFER_CONCURRENCY) as pool:
+        sent = sum(pool.map(send, range(1, count + 1)))
+    complete_multipart_upload(key, upload_id, count)
+    TRANSFER_STATS.record("upload", sent, time.monotonic() - start)
+
+
+def generate_multipart_upload_urls(key, size, expiry_seconds=3600, upload_id=None):
+    """
+    Presigned part PUTs for a browser to upload a large PDF in parallel.
+    Passing the `upload_id` of an earlier call resumes that upload,
+    listing only the parts still missing; the server never sees the bytes
+    to check them, so only the client that started an upload may resume
+    it. Without one, a fresh upload is started and any other unfinished
+    upload to `key` is aborted. Finish with complete_multipart_upload.
+    """
+    upload_id, done = _open_multipart_upload(key, upload_id)
+
+    count = math.ceil(size / PART_SIZE)
+    urls = []
+    for number in range(1, count + 1):
+        length = min(PART_SIZE, size - (number - 1) * PART_SIZE)
+        if number in done and done[number][1] == length:
+            continue
+        urls.append({
+            "part_number": number,
+            "url": s3.generate_presigned_url(
+                ClientMethod="upload_part",
+                Params={
+                    "Bucket": BUCKET,
+                    "Key": key,
+                    "UploadId": upload_id,
+                    "PartNumber": number,
+                },
+                ExpiresIn=expiry_seconds,
+            ),
+        })
+    return {"upload_id": upload_id, "part_size": PART_SIZE, "parts": urls}
+
+
+def content_hash(fileobj, chunk_size=1 << 20):
+    """
+    sha256 hex digest of a file object's bytes, read in chunks.
+    The object is rewound so it can still be uploaded afterwards.
+    """
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(chunk_size), b""):
+        h.update(chunk)
+    fileobj.seek(0)
+    return h.hexdigest()
@@ -7,8 +7,13 @@ load_dotenv()
 
 from uuid import UUID, uuid4
 
+import json
+import math
 import os
-from flask import Flask, make_response, redirect, session, jsonify, request
+import queue
+import threading
+import time
+from flask import Flask, Response, make_response, redirect, session, jsonify, request
 from authlib.integrations.flask_client import OAuth
 
 from db import *
@@ -133,10 +138,8 @@ def create_class():
     data = request.get_json()
 
     
-    classes = db.get_user(user["sub"])["classes"]
+    # create_class also enrolls the owner
     id = UUID(db.create_class(user["sub"], data["name"], data["desc"]))
-    classes.append(id)
-    db.update_user_classes(user["sub"], classes)
     
     return jsonify({"id": id})
 
@@ -287,25 +290,17 @@ def create_teacher_file():
 
 
 
-@app.route("/api/upload/<path:path>", methods=["POST"])
-def upload_to_s3(path):
-    if "file" not in request.files:
-        return jsonify({"error": "No file part"}), 400
-    dbfile = db.get_file(path)
-    if dbfile is None:
-        return jsonify({"error": "No such file exists"}), 404
-
-    file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "No selected file"}), 400
-
-    s3.upload_fileobj(
-        file,
-        BUCKET,
-        path  # use path here, not 'key'
-    )
-
-
+def enqueue_upload_tasks(path, dbfile):
+    """
+    Queue the work for a freshly uploaded file: OCR for every file, and
+    for a student submission the grading of it against the assignment's
+    key. Returns an error response, or None when everything was queued.
+    """
+    # Check for a key first so a refused submission queues nothing
+    if dbfile["file_role"] == FileRole.STUDENT_RESPONSE.value:
+        ass = db.get_assignment(dbfile["file_assignment"])
+        if len(ass["files"]) == 0:
+            return jsonify("Assignment has not key"), 500
 
     db.enqueue_file_task(TaskType.OCR, [path], "{}")
     print(dbfile)
@@ -318,19 +313,301 @@ def upload_to_s3(path):
         
         
     if dbfile["file_role"] == FileRole.STUDENT_RESPONSE.value:
-        ass = db.get_assignment(dbfile["file_assignment"])
-        if len(ass["files"]) == 0:
-            return jsonify("Assignment has not key"), 500
         db.enqueue_text_task(TaskType.SUMMARIZE, [""], [
             UUID(path), ass["files"][0]
         ])
 
+    return None
 
-    
+
+@app.route("/api/upload/<path:path>", methods=["POST"])
+def upload_to_s3(path):
+    """
+    Legacy upload proxied through this worker. New clients use
+    /api/upload_url + /api/upload_complete and never send bytes here.
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    dbfile = db.get_file(path)
+    if dbfile is None:
+        return jsonify({"error": "No such file exists"}), 404
+
+    file = request.files["file"]
+    if file.filename == "":
+        return jsonify({"error": "No selected file"}), 400
+
+    # Claim the completion first, as upload_complete does: a repeated or
+    # racing upload neither overwrites the stored PDF nor queues it twice
+    if not db.mark_file_uploaded(path):
+        return jsonify({"message": "Upload already complete", "url": generate_download_url(path)})
+
+    try:
+        # Hash while we have the bytes so the runner can reuse OCR results
+        digest = content_hash(file.stream)
+        upload_stream(file.stream, path)
+        db.set_file_content_hash(path, digest)
+    except Exception:
+        db.clear_file_uploaded(path)
+        raise
+
+    error = enqueue_upload_tasks(path, dbfile)
+    if error is not None:
+        db.clear_file_uploaded(path)
+        return error
 
     return jsonify({"message": "Upload successful", "url": generate_download_url(path)})
 
 
+@app.route("/api/upload_url/<path:path>", methods=["POST"])
+def get_upload_url(path):
+    """
+    Hand out a presigned PUT so the browser uploads the PDF straight to
+    the bucket, then calls /api/upload_complete/<path>.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"logged_in": False}), 401
+
+    dbfile = db.get_file(path)
+    if dbfile is None:
+        return jsonify({"error": "No such file exists"}), 404
+    if dbfile["posted_user"] != user["sub"]:
+        return jsonify({"error": "Not your file"}), 403
+
+    return jsonify({
+        "url": generate_upload_url(path, UPLOAD_URL_EXPIRY, "application/pdf"),
+        "method": "PUT",
+        "headers": {"Content-Type": "application/pdf"},
+        "expires_in": UPLOAD_URL_EXPIRY,
+    })
+
+
+@app.route("/api/upload_parts/<path:path>", methods=["POST"])
+def get_upload_part_urls(path):
+    """
+    Presigned part PUTs for a large PDF, uploaded in parallel by the
+    browser. Calling it again with {"upload_id": ...} resumes that upload
+    and lists only the parts still missing. Finish with
+    /api/upload_complete/<path> and {"upload_id": ..., "size": ...}.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"logged_in": False}), 401
+
+    dbfile = db.get_file(path)
+    if dbfile is None:
+        return jsonify({"error": "No such file exists"}), 404
+    if dbfile["posted_user"] != user["sub"]:
+        return jsonify({"error": "Not your file"}), 403
+
+    body = request.get_json(silent=True) or {}
+    size = body.get("size")
+    if not isinstance(size, int) or size <= 0 or size > MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"Upload must be 1 to {MAX_UPLOAD_BYTES} bytes"}), 400
+
+    return jsonify(
+        generate_multipart_upload_urls(path, size, UPLOAD_URL_EXPIRY, body.get("upload_id"))
+    )
+
+
+@app.route("/api/upload_complete/<path:path>", methods=["POST"])
+def upload_complete(path):
+    """
+    Completion callback for a direct upload: checks the object landed in
+    the bucket with a sane size and type, then queues OCR and grading.
+    The runner hashes the bytes when it downloads them.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"logged_in": False}), 401
+
+    dbfile = db.get_file(path)
+    if dbfile is None:
+        return jsonify({"error": "No such file exists"}), 404
+    if dbfile["posted_user"] != user["sub"]:
+        return jsonify({"error": "Not your file"}), 403
+    if dbfile["uploaded_at"] is not None:
+        # Retried or duplicate callback: the work is already queued
+        return jsonify({"message": "Upload already complete", "url": generate_download_url(path)})
+
+    body = request.get_json(silent=True) or {}
+    upload_id = body.get("upload_id")
+    if upload_id:
+        size = body.get("size")
+        part_count = math.ceil(size / PART_SIZE) if isinstance(size, int) and size > 0 else None
+        try:
+            complete_multipart_upload(path, upload_id, part_count)
+        except (ValueError, ClientError) as e:
+            return jsonify({"error": f"Could not complete upload: {e}"}), 409
+
+    head = head_object(path)
+    if head is None:
+        return jsonify({"error": "Nothing was uploaded for this file"}), 409
+    if head["size"] == 0 or head["size"] > MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"Upload must be 1 to {MAX_UPLOAD_BYTES} bytes"}), 400
+    if head["content_type"] != "application/pdf":
+        return jsonify({"error": "Upload is not a PDF"}), 400
+
+    # Claim the completion; a concurrent duplicate loses here
+    if not db.mark_file_uploaded(path):
+        return jsonify({"message": "Upload already complete", "url": generate_download_url(path)})
+    error = enqueue_upload_tasks(path, dbfile)
+    if error is not None:
+        db.clear_file_uploaded(path)
+        return error
+
+    return jsonify({"message": "Upload successful", "url": generate_download_url(path)})
+
+
+
+# -----------------------
+# Live submission status (SSE)
+# -----------------------
+# Idle SSE streams send a comment this often so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+# A stream ends after this long and the browser's EventSource reconnects,
+# so no request holds a worker thread indefinitely
+SSE_MAX_LIFETIME_SECONDS = int(os.getenv("SSE_MAX_LIFETIME_SECONDS", "300"))
+# Open streams per server process; keep it well under gunicorn's --threads
+# so ordinary /api requests always have threads left
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", "32"))
+# Reconnect delay sent to clients (ms), longer when turned away at the cap
+SSE_RETRY_MS = 1000
+SSE_BUSY_RETRY_MS = 15000
+
+
+class StatusBroker:
+    """
+    One LISTEN connection per server process on STATUS_CHANNEL, fanning
+    each state change out to the SSE streams subscribed to that file.
+    Started lazily by the first subscriber.
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+        self._lock = threading.Lock()
+        self._subscribers = {}  # file id -> set of queue.Queue
+        self._thread = None
+
+    def subscribe(self, file_ids):
+        q = queue.Queue()
+        with self._lock:
+            for fid in file_ids:
+                self._subscribers.setdefault(fid, set()).add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q, file_ids):
+        with self._lock:
+            for fid in file_ids:
+                subs = self._subscribers.get(fid)
+                if subs is not None:
+                    subs.discard(q)
+                    if not subs:
+                        del self._subscribers[fid]
+
+    def _publish(self, payload):
+        event = json.loads(payload)
+        with self._lock:
+            subs = list(self._subscribers.get(event["file"], ()))
+        for q in subs:
+            q.put(event)
+
+    def _run(self):
+        while True:
+            try:
+                con = self.db.listen([STATUS_CHANNEL])
+                try:
+                    while True:
+                        for n in DB.wait_for_notifies(con, SSE_KEEPALIVE_SECONDS):
+                            self._publish(n.payload)
+                finally:
+                    con.close()
+            except Exception as e:
+                print(f"Status listener failed, reconnecting: {e}")
+                time.sleep(1)
+
+
+status_broker = StatusBroker(db)
+
+
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/events/<path:path>")
+def submission_events(path):
+    """
+    Server-Sent Events stream of the user's files on an assignment: one
+    `status` event per file with its current state, then one per change
+    (queued, ocr_running, ocr_done, grading, graded, failed) as it happens.
+    Streams close after SSE_MAX_LIFETIME_SECONDS and the client reconnects;
+    past SSE_MAX_STREAMS open streams a client gets the snapshot only and
+    is told to come back later.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"logged_in": False}), 401
+
+    file_ids = [f["id"] for f in db.get_file_by_user_on_assignment(user["sub"], UUID(path))]
+
+    if not sse_slots.acquire(blocking=False):
+        snapshot = db.get_submission_states(file_ids)
+
+        def busy():
+            yield f"retry: {SSE_BUSY_RETRY_MS}\n\n"
+            for fid, state in snapshot.items():
+                yield sse_event("status", {"file": fid, "state": state})
+
+        return Response(
+            busy(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        # Subscribe before reading the snapshot so no change falls in between
+        events = status_broker.subscribe(file_ids)
+        snapshot = db.get_submission_states(file_ids)
+    except Exception:
+        sse_slots.release()
+        raise
+
+    def stream():
+        deadline = time.monotonic() + SSE_MAX_LIFETIME_SECONDS
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        for fid, state in snapshot.items():
+            yield sse_event("status", {"file": fid, "state": state})
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = events.get(timeout=min(SSE_KEEPALIVE_SECONDS, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_event("status", event)
+
+    def release():
+        status_broker.unsubscribe(events, file_ids)
+        sse_slots.release()
+
+    response = Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the server closes the response, even if the client left
+    # before the generator started
+    response.call_on_close(release)
+    return response
+
 
 @app.route("/api/submission/<path:path>")
 def get_sub(path):
@@ -339,7 +616,11 @@ def get_sub(path):
         return jsonify({"logged_in": False}), 401
 
 
-    return jsonify(db.get_file_by_user_on_assignment(user["sub"], UUID(path)))
+    files = db.get_file_by_user_on_assignment(user["sub"], UUID(path))
+    urls = generate_download_urls([f["id"] for f in files])
+    for f in files:
+        f["url"] = urls[f["id"]]
+    return jsonify(files)
 
 @app.route("/api/score/<path:path>")
 def get_results_for_assignment(path):
@@ -354,6 +635,60 @@ def get_results_for_assignment(path):
 
 
 
+# Roster page size: default and upper bound
+ROSTER_PAGE = 100
+ROSTER_MAX_PAGE = 1000
+
+
+
+@app.route("/api/class_roster/<path:path>")
+def get_class_roster(path):
+    """
+    Members of a class, for its owner. Paginated: pass the previous
+    page's next_cursor as ?cursor=.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"logged_in": False}), 401
+
+    class_id = UUID(path)
+    if db.get_class_owner(class_id) != user["sub"]:
+        return jsonify({"error": "Not your class"}), 403
+
+    limit = min(request.args.get("limit", ROSTER_PAGE, type=int), ROSTER_MAX_PAGE)
+    return jsonify(db.get_class_roster(class_id, request.args.get("cursor"), max(limit, 1)))
+
+
+# Gradebook page size: default and upper bound
+GRADEBOOK_PAGE = 50
+GRADEBOOK_MAX_PAGE = 500
+
+
+@app.route("/api/gradebook/<path:path>")
+def get_gradebook(path):
+    """
+    Every student's latest result on an assignment, for the teacher who
+    owns it. Paginated: pass the previous page's next_cursor as ?cursor=.
+    """
+    user = session.get('user')
+    if not user:
+        return jsonify({"logged_in": False}), 401
+    if user["role"] != "teacher":
+        return jsonify({"error": "Not a teacher"}), 401
+
+    assignment = UUID(path)
+    if db.get_assignment_owner(assignment) != user["sub"]:
+        return jsonify({"error": "Not your assignment"}), 403
+
+    limit = min(request.args.get("limit", GRADEBOOK_PAGE, type=int), GRADEBOOK_MAX_PAGE)
+    return jsonify(
+        db.get_assignment_gradebook(assignment, request.args.get("cursor"), max(limit, 1))
+    )
+
+
+
+
+
 if __name__ == "__main__":
     # Use host=0.0.0.0 if testing in Docker or remote VM
     app.run(host="127.0.0.1", port=8010, debug=True)
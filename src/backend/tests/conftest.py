@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the backend modules the way the services do, by file name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tables the database tests write to; emptied around every such test
+SCRATCH_TABLES = [
+    "file_task",
+    "text_task",
+    "text_task_dep",
+    "failed_tasks",
+    "file_cache",
+    "user_results",
+]
+
+
+@pytest.fixture
+def db():
+    """
+    DB on the scratch database named by TEST_DATABASE_URL (migrated on
+    first use). Its queue and result tables are wiped, so never point it
+    at real data. Skipped when the variable is unset.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL not set")
+    os.environ["DATABASE_URL"] = url
+    from db import DB
+
+    database = DB()
+
+    def wipe():
+        with database._conn_cur() as (_, cur):
+            cur.execute(f"TRUNCATE {', '.join(SCRATCH_TABLES)}")
+
+    wipe()
+    try:
+        yield database
+    finally:
+        wipe()
+        database.close()
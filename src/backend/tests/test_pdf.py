@@ -0,0 +1,100 @@
+import io
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.annotations import FreeText
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+)
+
+from pdf import has_non_text_content, plan_pages
+
+TYPED_LINE = "Question one asks students to compute the derivative of the function shown here"
+
+
+def _typed_pdf(pages: int = 1, annotate: bool = False, image: bool = False, form: bool = False) -> bytes:
+    """PDF whose pages are typeset text, optionally with student marks on page 1."""
+    writer = PdfWriter()
+    for _ in range(pages):
+        page = writer.add_blank_page(612, 792)
+        font = DictionaryObject({
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        })
+        resources = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+        })
+        lines = "".join(f"({TYPED_LINE}) Tj 0 -14 Td " for _ in range(6))
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 10 Tf 40 740 Td {lines}ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = resources
+
+    if image:
+        img = DecodedStreamObject()
+        img.set_data(b"\x00")
+        img.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(1),
+            NameObject("/Height"): NumberObject(1),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+        })
+        writer.pages[0]["/Resources"][NameObject("/XObject")] = DictionaryObject(
+            {NameObject("/Im1"): writer._add_object(img)}
+        )
+    if annotate:
+        writer.add_annotation(0, FreeText(text="x = 3", rect=(50, 50, 200, 100)))
+    if form:
+        writer._root_object[NameObject("/AcroForm")] = DictionaryObject(
+            {NameObject("/Fields"): ArrayObject()}
+        )
+
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def test_typed_answer_key_is_read_from_text_layer():
+    plan = plan_pages(_typed_pdf(), 4)
+    assert len(plan) == 1
+    first, last, pdf, text = plan[0]
+    assert (first, last, pdf) == (1, 1, None)
+    assert TYPED_LINE in text
+
+
+def test_student_copies_skip_the_text_layer():
+    data = _typed_pdf()
+    assert plan_pages(data, 4, use_text_layer=False) == [(1, 1, data, None)]
+
+
+def test_annotated_page_goes_to_the_model():
+    data = _typed_pdf(pages=2, annotate=True)
+    plan = plan_pages(data, 4)
+    assert [(first, last, text is None) for first, last, _, text in plan] == [
+        (1, 1, True),
+        (2, 2, False),
+    ]
+    assert plan[0][2] is not None
+
+
+def test_page_with_image_goes_to_the_model():
+    plan = plan_pages(_typed_pdf(image=True), 4)
+    assert plan[0][3] is None
+
+
+def test_form_document_goes_to_the_model():
+    data = _typed_pdf(pages=2, form=True)
+    assert plan_pages(data, 4) == [(1, 2, data, None)]
+
+
+def test_has_non_text_content():
+    plain = PdfReader(io.BytesIO(_typed_pdf())).pages[0]
+    marked = PdfReader(io.BytesIO(_typed_pdf(annotate=True))).pages[0]
+    assert not has_non_text_content(plain)
+    assert has_non_text_content(marked)
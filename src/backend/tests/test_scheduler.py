@@ -0,0 +1,52 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("openai")
+# runner imports s3, which builds its client from these at import time
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+from runner import AsyncTaskScheduler, TaskScheduler
+
+
+def test_redequeued_task_is_skipped_while_running():
+    scheduler = TaskScheduler(2)
+    release = threading.Event()
+    runs = []
+
+    def work():
+        runs.append(1)
+        release.wait(5)
+
+    try:
+        assert scheduler.submit(("text", 7), work) is not None
+        # Lease reclaimed and the same task claimed again by this runner
+        assert scheduler.submit(("text", 7), work) is None
+        assert scheduler.running() == [("text", 7)]
+    finally:
+        release.set()
+        scheduler.shutdown()
+    assert runs == [1]
+
+
+def test_async_redequeued_task_is_skipped_while_running():
+    async def scenario():
+        scheduler = AsyncTaskScheduler(2)
+        release = asyncio.Event()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await release.wait()
+
+        assert scheduler.submit(("file", 3), work()) is not None
+        assert scheduler.submit(("file", 3), work()) is None
+        assert scheduler.running() == [("file", 3)]
+        release.set()
+        await scheduler.shutdown()
+        return runs
+
+    assert asyncio.run(scenario()) == [1]
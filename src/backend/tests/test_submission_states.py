@@ -0,0 +1,93 @@
+import json
+import uuid
+
+from db import STATUS_CHANNEL, DB, SubmissionState, TaskType
+
+WORKER = "test-worker"
+
+
+def _state(db: DB, file_id: str) -> str:
+    return db.get_submission_states([file_id])[file_id]
+
+
+def _new_file() -> str:
+    return str(uuid.uuid4())
+
+
+def _queue_grading(db: DB, student: str) -> int:
+    """Answer key OCR'd, student copy OCR'd, grading task waiting."""
+    key = _new_file()
+    db.set_file_cache(key, "key text")
+    db.set_file_cache(student, "student text")
+    return db.enqueue_text_task(TaskType.SUMMARIZE, [""], [student, key])
+
+
+def test_uploading(db):
+    f = _new_file()
+    assert _state(db, f) == SubmissionState.UPLOADING.value
+
+
+def test_queued(db):
+    f = _new_file()
+    db.enqueue_file_task(TaskType.OCR, [f])
+    assert _state(db, f) == SubmissionState.QUEUED.value
+
+
+def test_ocr_running(db):
+    f = _new_file()
+    db.enqueue_file_task(TaskType.OCR, [f])
+    assert db.dequeue_file_tasks(1, WORKER)
+    assert _state(db, f) == SubmissionState.OCR_RUNNING.value
+
+
+def test_ocr_done(db):
+    f = _new_file()
+    db.set_file_cache(f, "text")
+    assert _state(db, f) == SubmissionState.OCR_DONE.value
+
+
+def test_ocr_done_while_grading_waits(db):
+    f = _new_file()
+    _queue_grading(db, f)
+    assert _state(db, f) == SubmissionState.OCR_DONE.value
+
+
+def test_grading(db):
+    f = _new_file()
+    _queue_grading(db, f)
+    assert db.dequeue_text_tasks(1, WORKER)
+    assert _state(db, f) == SubmissionState.GRADING.value
+
+
+def test_graded(db):
+    f = _new_file()
+    _queue_grading(db, f)
+    db.add_user_result(f, "feedback")
+    assert _state(db, f) == SubmissionState.GRADED.value
+
+
+def test_failed_grading_is_failed_not_ocr_done(db):
+    f = _new_file()
+    task_id = _queue_grading(db, f)
+    assert db.dequeue_text_tasks(1, WORKER)
+    assert db.fail_text_task(task_id, "boom", max_attempts=1, worker_id=WORKER) is True
+    assert _state(db, f) == SubmissionState.FAILED.value
+
+
+def test_requeue_notification_matches_snapshot(db):
+    f = _new_file()
+    task_id = _queue_grading(db, f)
+    assert db.dequeue_text_tasks(1, WORKER)
+
+    con = db.listen([STATUS_CHANNEL])
+    try:
+        assert db.fail_text_task(task_id, "boom", max_attempts=5, worker_id=WORKER) is False
+        published = [
+            json.loads(n.payload)
+            for n in DB.wait_for_notifies(con, 5)
+            if json.loads(n.payload)["file"] == f
+        ]
+    finally:
+        con.close()
+
+    assert published[-1]["state"] == _state(db, f) == SubmissionState.OCR_DONE.value
@@ -5,6 +5,73 @@ import Rubric from "../components/Rubric";
 import { useUser } from "../context/UserContext";
 import "../styles/AssignmentPage.css";
 
+// Files above this go up as parallel multipart parts
+const MULTIPART_THRESHOLD = 16 * 1024 * 1024;
+const PART_CONCURRENCY = 4;
+
+const PART_ATTEMPTS = 3;
+
+// PUT the missing parts of a multipart upload, a few at a time. After a
+// failure the backend is asked again with the same upload_id, which
+// resumes with only the parts not yet stored.
+const uploadParts = async (fileId, file) => {
+    let uploadId = null;
+    for (let attempt = 1; ; attempt++) {
+        const partsRes = await fetch(`/api/upload_parts/${fileId}`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ size: file.size, upload_id: uploadId }),
+        });
+        if (!partsRes.ok) throw new Error("Could not start upload");
+        const { upload_id, part_size, parts } = await partsRes.json();
+        uploadId = upload_id;
+
+        const queue = [...parts];
+        const worker = async () => {
+            while (queue.length > 0) {
+                const { part_number, url } = queue.shift();
+                const start = (part_number - 1) * part_size;
+                const putRes = await fetch(url, {
+                    method: "PUT",
+                    body: file.slice(start, start + part_size),
+                });
+                if (!putRes.ok) throw new Error(`Upload of part ${part_number} failed`);
+            }
+        };
+        try {
+            await Promise.all(Array.from({ length: PART_CONCURRENCY }, worker));
+            return { upload_id: uploadId, size: file.size };
+        } catch (err) {
+            if (attempt >= PART_ATTEMPTS) throw err;
+        }
+    }
+};
+
+// Upload a PDF straight to storage with a presigned PUT (or parts, for
+// large scans), then tell the backend it landed so it can queue OCR and
+// grading.
+const uploadPdf = async (fileId, file) => {
+    let completion = {};
+    if (file.size > MULTIPART_THRESHOLD) {
+        completion = await uploadParts(fileId, file);
+    } else {
+        const urlRes = await fetch(`/api/upload_url/${fileId}`, { method: "POST" });
+        if (!urlRes.ok) throw new Error("Could not start upload");
+        const { url, method, headers } = await urlRes.json();
+
+        const putRes = await fetch(url, { method, headers, body: file });
+        if (!putRes.ok) throw new Error("File upload failed");
+    }
+
+    const doneRes = await fetch(`/api/upload_complete/${fileId}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(completion),
+    });
+    if (!doneRes.ok) throw new Error("File upload failed");
+    return doneRes.json();
+};
+
 const AssignmentPage = () => {
     const { courseId, assignmentId } = useParams();
     const location = useLocation();
@@ -46,17 +113,8 @@ const AssignmentPage = () => {
             if (!createRes.ok) throw new Error("Failed to create student file record");
             const { id: fileId } = await createRes.json();
 
-            // Step 2: Upload file to S3
-            const formData = new FormData();
-            formData.append("file", selectedFile);
-
-            const uploadRes = await fetch(`/api/upload/${fileId}`, {
-                method: "POST",
-                body: formData,
-            });
-
-            if (!uploadRes.ok) throw new Error("File upload failed");
-            const data = await uploadRes.json();
+            // Step 2: Upload file directly to S3
+            const data = await uploadPdf(fileId, selectedFile);
 
             console.log("Student file uploaded:", data.url);
 
@@ -113,16 +171,7 @@ const AssignmentPage = () => {
             if (!createRes.ok) throw new Error("Failed to create teacher file record");
             const { id: fileId } = await createRes.json();
 
-            const formData = new FormData();
-            formData.append("file", answerKeyFile);
-
-            const uploadRes = await fetch(`/api/upload/${fileId}`, {
-                method: "POST",
-                body: formData,
-            });
-
-            if (!uploadRes.ok) throw new Error("File upload failed");
-            const data = await uploadRes.json();
+            const data = await uploadPdf(fileId, answerKeyFile);
 
             console.log("Teacher file uploaded:", data.url);
             alert("Answer key uploaded successfully!");
@@ -50,6 +50,15 @@ const SubmissionDetailsPage = () => {
         };
 
         fetchScore();
+
+        // Refresh the score the moment grading finishes instead of polling
+        if (!assignmentId) return;
+        const events = new EventSource(`/api/events/${assignmentId}`);
+        events.addEventListener("status", (e) => {
+            const { state } = JSON.parse(e.data);
+            if (state === "graded") fetchScore();
+        });
+        return () => events.close();
     }, [submission]);
 
 